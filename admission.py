@@ -0,0 +1,230 @@
+"""
+Process-wide admission control for chat backend calls (app01.py, app02.py).
+
+Every Streamlit session runs in the same server process, so one controller
+(held in st.cache_resource) can stop a burst of users from piling onto the
+model server:
+- a token bucket caps how fast new calls start (rate per second, with burst)
+- a bounded number of calls may run at once
+- callers wait in a strict FIFO queue and can report their position while
+  they wait; a full queue is rejected at once instead of timing out later
+
+Identical requests that are already in flight (e.g. two users pressing the
+same quick-start button) are coalesced. Only the first one is sent; its
+output is broadcast to everyone who asked. The call itself runs on a
+background thread, so the result does not depend on the first session
+staying connected.
+
+Limits come from the environment: CHAT_MAX_CONCURRENT, CHAT_RATE_PER_SEC,
+CHAT_BURST, CHAT_MAX_QUEUE.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+MAX_CONCURRENT = int(os.environ.get("CHAT_MAX_CONCURRENT", 4))
+RATE_PER_SEC = float(os.environ.get("CHAT_RATE_PER_SEC", 2.0))
+BURST = int(os.environ.get("CHAT_BURST", 4))
+MAX_QUEUE = int(os.environ.get("CHAT_MAX_QUEUE", 50))
+POLL_SECONDS = 0.25
+
+
+class QueueFull(Exception):
+    """Raised when the wait queue is at capacity."""
+
+
+def request_key(*parts: Any) -> str:
+    """Stable hash of everything that determines a backend call."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class AdmissionController:
+    """Token bucket plus concurrency limit, with a fair FIFO wait queue."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, rate: float = RATE_PER_SEC,
+                 burst: int = BURST, max_queue: int = MAX_QUEUE):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._active = 0
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self.admitted = 0
+        self.rejected = 0
+
+    def _take_token(self) -> float:
+        """Take a token if one is available (returns 0), else seconds until the next one."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self, on_wait: Optional[Callable[[int], None]] = None):
+        """Block until admitted. on_wait(position) is called, without the lock held, whenever the
+        1-based position changes."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{len(self._queue)} requests are already waiting")
+            ticket = object()
+            self._queue.append(ticket)
+            last_position = None
+            try:
+                while True:
+                    timeout = POLL_SECONDS
+                    if self._queue[0] is ticket and self._active < self.max_concurrent:
+                        refill_wait = self._take_token()
+                        if refill_wait == 0:
+                            self._queue.popleft()
+                            self._active += 1
+                            self.admitted += 1
+                            self._cond.notify_all()
+                            return
+                        timeout = min(timeout, refill_wait)
+                    position = self._queue.index(ticket) + 1
+                    if on_wait is not None and position != last_position:
+                        last_position = position
+                        # Outside the lock: the callback may draw UI, and the queue must not wait for it
+                        self._cond.release()
+                        try:
+                            on_wait(position)
+                        finally:
+                            self._cond.acquire()
+                        continue  # the queue may have moved meanwhile
+                    self._cond.wait(timeout)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+                raise
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, on_wait: Optional[Callable[[int], None]] = None):
+        self.acquire(on_wait)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'active': self._active,
+                'queued': len(self._queue),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
+
+
+class Flight:
+    """One in-flight call whose output chunks are broadcast to every subscriber."""
+
+    def __init__(self):
+        self._chunks: List[Any] = []
+        self._cond = threading.Condition()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.position: Optional[int] = None
+        self.meta: Dict[str, Any] = {}
+        self.subscribers = 0
+
+    def set_position(self, position: Optional[int]):
+        with self._cond:
+            self.position = position
+            self._cond.notify_all()
+
+    def publish(self, chunk: Any):
+        with self._cond:
+            self.position = None
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.position = None
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def subscribe(self, on_wait: Optional[Callable[[int], None]] = None) -> Iterator[Any]:
+        """Every chunk from the start, then new ones as they arrive; re-raises the call's error."""
+        index = 0
+        shown_position = None
+        while True:
+            with self._cond:
+                if index == len(self._chunks) and not self.done:
+                    self._cond.wait(POLL_SECONDS)
+                chunks = self._chunks[index:]
+                index += len(chunks)
+                done = self.done and index == len(self._chunks)
+                position = self.position
+            if on_wait is not None and position is not None and position != shown_position:
+                on_wait(position)
+                shown_position = position
+            yield from chunks
+            if done:
+                break
+        if self.error is not None:
+            raise self.error
+
+
+class RequestCoalescer:
+    """Runs at most one call per request key; later identical requests join the running one."""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: str, produce: Callable[[Flight], None]) -> Tuple[Flight, bool]:
+        """Return (flight, started_here). produce(flight) runs on a new thread and publishes chunks."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.subscribers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            flight.subscribers = 1
+            self.started += 1
+        threading.Thread(target=self._run, args=(key, flight, produce), daemon=True).start()
+        return flight, True
+
+    def _run(self, key: str, flight: Flight, produce: Callable[[Flight], None]):
+        error = None
+        try:
+            produce(flight)
+        except BaseException as e:
+            error = e
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.finish(error)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'in_flight': len(self._flights), 'started': self.started, 'coalesced': self.coalesced}
+
+
+def queue_message(position: int) -> str:
+    if position == 1:
+        return "⏳ You're next in line for the assistant..."
+    return f"⏳ The assistant is busy. You are #{position} in line..."
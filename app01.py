@@ -1,8 +1,19 @@
 import streamlit as st
+import html
 import time
 import requests
 from datetime import datetime
 
+from admission import AdmissionController, QueueFull, RequestCoalescer, queue_message, request_key
+from chat_backend import RESPONSE_MODES, SYNC_MODES, ConversationSync, format_timing, open_turn
+from chat_dispatch import DISPATCH_MODES, ChatDispatcher, DispatchResult
+from chat_history import (
+    conversation_metrics, new_conversation, open_conversation, render_chat_history, render_history_search
+)
+from conversation_store import ConversationStore
+from http_client import DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE, PooledHTTPClient
+from response_cache import ResponseCache, cache_key, cacheable, replay
+
 
 # Page configuration
 st.set_page_config(
@@ -61,9 +72,130 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+MESSAGE_HTML_CACHE_SIZE = 200
+
+
+@st.cache_resource
+def get_conversation_store() -> ConversationStore:
+    """Shared by every session; each session keeps only its conversation id."""
+    return ConversationStore()
+
+
+@st.cache_resource
+def get_http_client() -> PooledHTTPClient:
+    """One pooled client, with a session per endpoint, shared by every session in the process."""
+    return PooledHTTPClient(pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES)
+
+
+def configure_http_client():
+    get_http_client().configure(
+        int(st.session_state.pool_size), int(st.session_state.max_retries), st.session_state.keep_alive
+    )
+
+
+@st.cache_resource
+def get_dispatcher() -> ChatDispatcher:
+    """Shared so hedging delays come from every session's latency history."""
+    return ChatDispatcher()
+
+
+@st.cache_resource
+def get_admission() -> AdmissionController:
+    """One queue and rate limit for every session in the process."""
+    return AdmissionController()
+
+
+@st.cache_resource
+def get_coalescer() -> RequestCoalescer:
+    return RequestCoalescer()
+
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    return ResponseCache()
+
+
+def result_text(result: DispatchResult) -> str:
+    if result.error is not None:
+        return f"⚠️ Error: {str(result.error)}"
+    if not result.ok:
+        return f"Error: API returned status code {result.reply.status_code}"
+    return result.text() or "No response received"
+
+
+def escape_content(text: str) -> str:
+    """Message text as HTML: escaped, line breaks kept. Works on deltas as well as whole texts."""
+    return html.escape(text).replace("\n", "<br>")
+
+
+def user_message_html(content: str, footer: str) -> str:
+    """content and footer must already be escaped."""
+    return f"""
+            <div class="chat-message user-message">
+                <div class="message-avatar">👤 You</div>
+                <div class="message-content">{content}</div>
+                <div class="timestamp">{footer}</div>
+            </div>
+            """
+
+
+def bot_message_html(content: str, footer: str) -> str:
+    """content and footer must already be escaped."""
+    return f"""
+            <div class="chat-message bot-message">
+                <div class="message-avatar">🤖 Assistant</div>
+                <div class="message-content">{content}</div>
+                <div class="timestamp">{footer}</div>
+            </div>
+            """
+
+
+def format_message_html(message: dict, endpoint: str = None) -> str:
+    if message["role"] == "user":
+        return user_message_html(escape_content(message["content"]), html.escape(message["timestamp"]))
+    if endpoint is not None:
+        return bot_message_html(escape_content(message["comparisons"][endpoint]), html.escape(endpoint))
+    return bot_message_html(escape_content(message["content"]), html.escape(message["timestamp"] + format_timing(message)))
+
+
+def message_html(message: dict, endpoint: str = None) -> str:
+    """Finished HTML for a message (or one column of a comparison), formatted once per session."""
+    cache = st.session_state.message_html
+    key = (message["id"], endpoint)
+    if key not in cache:
+        cache[key] = format_message_html(message, endpoint)
+        if len(cache) > MESSAGE_HTML_CACHE_SIZE:
+            del cache[next(iter(cache))]  # oldest entry
+    return cache[key]
+
+
+def add_message(role: str, content: str, **fields) -> dict:
+    metrics = conversation_metrics(get_conversation_store(), st.session_state.conversation_id)
+    message = get_conversation_store().append(
+        st.session_state.conversation_id,
+        role,
+        content,
+        timestamp=datetime.now().strftime("%I:%M %p"),
+        **fields
+    )
+    metrics.record(message)
+    # Escape and format now; every later rerun reuses the cached HTML
+    message_html(message)
+    for endpoint in message.get("comparisons") or ():
+        message_html(message, endpoint)
+    return message
+
+
+def queue_prompt(prompt: str):
+    st.session_state.pending_prompt = prompt
+
+
 # Initialize session state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+store = get_conversation_store()
+conversation_id = open_conversation(store, "app01")
+
+if "message_html" not in st.session_state:
+    st.session_state.message_html = {}  # (message id, comparison endpoint or None) -> HTML
 
 if "api_endpoint" not in st.session_state:
     st.session_state.api_endpoint = "http://localhost:8000/chat"
@@ -71,8 +203,16 @@ if "api_endpoint" not in st.session_state:
 if "api_key" not in st.session_state:
     st.session_state.api_key = ""
 
-# Sidebar configuration
-with st.sidebar:
+if "extra_endpoints" not in st.session_state:
+    st.session_state.extra_endpoints = ""
+
+if "conversation_syncs" not in st.session_state:
+    st.session_state.conversation_syncs = {}  # endpoint -> ConversationSync
+
+# Sidebar configuration: a fragment, so changing a setting reruns only the sidebar and
+# never re-renders the transcript. A full run (e.g. a new turn) returns the settings.
+@st.fragment
+def sidebar_settings():
     st.title("⚙️ Settings")
     
     # API Configuration
@@ -84,6 +224,24 @@ with st.sidebar:
     )
     st.session_state.api_endpoint = api_endpoint
     
+    extra_endpoints = st.text_area(
+        "Additional Endpoints (one per line)",
+        value=st.session_state.extra_endpoints,
+        help="Replicas used for hedged requests, or the other backends in Compare mode"
+    )
+    st.session_state.extra_endpoints = extra_endpoints
+    endpoints = [api_endpoint] + [
+        line.strip() for line in extra_endpoints.splitlines()
+        if line.strip() and line.strip() != api_endpoint
+    ]
+    dispatch_mode = st.radio(
+        "Dispatch Mode",
+        DISPATCH_MODES,
+        horizontal=True,
+        help="Hedged re-sends to the next endpoint when the primary is slower than its p95; "
+             "Compare sends every turn to all endpoints"
+    )
+    
     api_key = st.text_input(
         "API Key (if required)",
         value=st.session_state.api_key,
@@ -92,25 +250,57 @@ with st.sidebar:
     )
     st.session_state.api_key = api_key
     
+    # Applied to the shared client only when changed here, so a stale value in another
+    # session never resets it
+    http_client = get_http_client()
+    with st.expander("Connection Pool"):
+        st.caption("Shared by every session of this server")
+        st.number_input("Pool Size (per endpoint)", 1, 100, http_client.pool_size, key="pool_size",
+                        on_change=configure_http_client)
+        st.number_input("Max Retries", 0, 10, http_client.max_retries, key="max_retries",
+                        on_change=configure_http_client)
+        st.checkbox("Keep-Alive", value=http_client.keep_alive, key="keep_alive", on_change=configure_http_client)
+    
     st.divider()
     
     # Chat settings
     st.subheader("Chat Settings")
     temperature = st.slider("Response Temperature", 0.0, 1.0, 0.7, 0.1)
     max_tokens = st.number_input("Max Response Tokens", 100, 4000, 1000, 100)
+    response_mode = st.radio(
+        "Response Mode",
+        RESPONSE_MODES,
+        horizontal=True,
+        help="Streaming renders the reply as it arrives (SSE, NDJSON or chunked text); JSON waits for the full reply"
+    )
+    use_cache = st.checkbox(
+        "Use response cache",
+        value=True,
+        help="Replay a stored reply when the same history and max tokens were already answered. "
+             "Only replies at temperature 0 are cached; above 0 every turn is sampled fresh"
+    )
+    sync_mode = st.radio(
+        "History Sync",
+        SYNC_MODES,
+        horizontal=True,
+        help="Delta keeps the conversation on the backend and sends only new messages; "
+             "Full history resends everything every turn"
+    )
     
     st.divider()
     
     # Chat history management
     st.subheader("Chat History")
     if st.button("🗑️ Clear Chat History", use_container_width=True):
-        st.session_state.messages = []
+        new_conversation(store, "app01")
+        st.session_state.message_html = {}
+        st.session_state.conversation_syncs = {}
         st.rerun()
     
     if st.button("💾 Export Chat", use_container_width=True):
         chat_export = "\n\n".join([
             f"[{msg['timestamp']}] {msg['role'].upper()}: {msg['content']}"
-            for msg in st.session_state.messages
+            for msg in store.messages(st.session_state.conversation_id)
         ])
         st.download_button(
             "Download Chat Log",
@@ -118,14 +308,16 @@ with st.sidebar:
             file_name=f"chat_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
             mime="text/plain"
         )
+    render_history_search(store, st.session_state.conversation_id)
     
     st.divider()
     
     # Statistics
     st.subheader("📊 Statistics")
-    total_messages = len(st.session_state.messages)
-    user_messages = sum(1 for m in st.session_state.messages if m["role"] == "user")
-    bot_messages = sum(1 for m in st.session_state.messages if m["role"] == "assistant")
+    chat_metrics = conversation_metrics(store, st.session_state.conversation_id)
+    total_messages = chat_metrics.total
+    user_messages = chat_metrics.messages["user"]
+    bot_messages = chat_metrics.messages["assistant"]
     
     col1, col2 = st.columns(2)
     with col1:
@@ -133,6 +325,60 @@ with st.sidebar:
         st.metric("User", user_messages)
     with col2:
         st.metric("Bot", bot_messages)
+        st.metric(
+            "Tokens (est.)",
+            f"{chat_metrics.total_tokens:,}",
+            help=f"{chat_metrics.tokens['user']:,} sent, {chat_metrics.tokens['assistant']:,} received"
+        )
+    
+    endpoint_metrics = http_client.metrics()
+    for endpoint, latency in get_dispatcher().latency.summary().items():
+        endpoint_metrics.setdefault(endpoint, {}).update(latency)
+    # This conversation's reply times, next to the process-wide numbers
+    for endpoint, latency in chat_metrics.latency_summary().items():
+        endpoint_metrics.setdefault(endpoint, {}).update({f"chat_{k}": v for k, v in latency.items()})
+    cache_stats = get_response_cache().stats()
+    st.metric(
+        "Cache hit rate",
+        f"{cache_stats['hit_rate']:.0%}",
+        help=f"{cache_stats['hits']} hits ({cache_stats['disk_hits']} from disk), "
+             f"{cache_stats['misses']} misses, {cache_stats['entries']} replies in memory"
+    )
+    admission_stats = get_admission().stats()
+    st.caption(
+        f"Backend queue: {admission_stats['active']} running · {admission_stats['queued']} waiting · "
+        f"{get_coalescer().stats()['coalesced']} shared replies"
+    )
+    if endpoint_metrics:
+        st.caption("Backend connections")
+        st.dataframe(
+            [{"endpoint": endpoint, **m} for endpoint, m in endpoint_metrics.items()],
+            hide_index=True,
+            use_container_width=True
+        )
+    
+    return {
+        "endpoints": endpoints,
+        "dispatch_mode": dispatch_mode,
+        "http_client": http_client,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "response_mode": response_mode,
+        "use_cache": use_cache,
+        "sync_mode": sync_mode,
+    }
+
+
+with st.sidebar:
+    settings = sidebar_settings()
+endpoints = settings["endpoints"]
+dispatch_mode = settings["dispatch_mode"]
+http_client = settings["http_client"]
+temperature = settings["temperature"]
+max_tokens = settings["max_tokens"]
+response_mode = settings["response_mode"]
+use_cache = settings["use_cache"] and cacheable(temperature)
+sync_mode = settings["sync_mode"]
         
         
 # Main chat interface
@@ -140,143 +386,208 @@ st.title("🤖 AI Chatbot")
 st.caption("Powered by your custom backend")
 
 # Display chat messages
+def render_message(message):
+    if message.get("comparisons"):
+        for column, endpoint in zip(st.columns(len(message["comparisons"])), message["comparisons"]):
+            column.markdown(message_html(message, endpoint), unsafe_allow_html=True)
+    else:
+        st.markdown(message_html(message), unsafe_allow_html=True)
+
+
 chat_container = st.container()
 
 with chat_container:
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            st.markdown(f"""
-            <div class="chat-message user-message">
-                <div class="message-avatar">👤 You</div>
-                <div class="message-content">{message["content"]}</div>
-                <div class="timestamp">{message["timestamp"]}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="chat-message bot-message">
-                <div class="message-avatar">🤖 Assistant</div>
-                <div class="message-content">{message["content"]}</div>
-                <div class="timestamp">{message["timestamp"]}</div>
-            </div>
-            """, unsafe_allow_html=True)
+    # Only the newest messages are read and rendered; older ones load on demand
+    render_chat_history(store, conversation_id, render_message)
 
-# Chat input
-user_input = st.chat_input("Type your message here...")
+# Chat input; a quick-start example arrives as a pending prompt and takes the same path
+user_input = st.chat_input("Type your message here...") or st.session_state.pop("pending_prompt", None)
 
 if user_input:
-    # Add user message to chat
-    timestamp = datetime.now().strftime("%I:%M %p")
-    st.session_state.messages.append({
-        "role": "user",
-        "content": user_input,
-        "timestamp": timestamp
-    })
-    
-    # Display user message immediately
+    # Add user message to chat and display it; the turn ends without a rerun,
+    # so this is the only time it is drawn in this run
+    user_message = add_message("user", user_input)
     with chat_container:
-        st.markdown(f"""
-        <div class="chat-message user-message">
-            <div class="message-avatar">👤 You</div>
-            <div class="message-content">{user_input}</div>
-            <div class="timestamp">{timestamp}</div>
-        </div>
-        """, unsafe_allow_html=True)
+        render_message(user_message)
+    
+    bot_response = ""
+    bot_html = ""  # escaped incrementally as deltas arrive
+    placeholder = None
+    slots = {}
+    reply = None
+    served_by = None
+    hedged = False
+    coalesced = False
+    from_cache = False
+    comparisons = None
+    completed = False
+    if dispatch_mode == "Single":
+        endpoints = endpoints[:1]
+    syncs = st.session_state.conversation_syncs
+    for endpoint in endpoints:
+        syncs.setdefault(endpoint, ConversationSync())
+    turn_messages = list(store.messages(conversation_id))
+    try:
+        # Prepare request headers
+        headers = {}
+        if st.session_state.api_key:
+            headers["Authorization"] = f"Bearer {st.session_state.api_key}"
         
+        def open_for(endpoint):
+            # Runs on a dispatcher thread; each backend keeps its own delta sync state
+            return open_turn(
+                http_client,
+                endpoint,
+                turn_messages,
+                {"temperature": temperature, "max_tokens": max_tokens},
+                headers,
+                sync=syncs[endpoint] if sync_mode == "Delta" else None,
+                streaming=response_mode == "Streaming",
+                timeout=30
+            )
         
+        compare = dispatch_mode == "Compare" and len(endpoints) > 1
+        reply_key = cache_key(
+            request_key(endpoints, st.session_state.api_key), None, turn_messages, temperature, max_tokens
+        )
+        cached = get_response_cache().get(reply_key) if use_cache and not compare else None
         
-    # Show typing indicator
-    with st.spinner("🤖 Assistant is typing..."):
-        try:
-            # Prepare request payload
-            headers = {"Content-Type": "application/json"}
-            if st.session_state.api_key:
-                headers["Authorization"] = f"Bearer {st.session_state.api_key}"
+        if cached is not None:
+            # Replay the stored reply as a stream so it renders like a live one
+            with chat_container:
+                placeholder = st.empty()
+            for delta in replay(cached):
+                bot_response += delta
+                bot_html += escape_content(delta)
+                placeholder.markdown(bot_message_html(bot_html + " ▌", "typing..."), unsafe_allow_html=True)
+            completed = True
+            from_cache = True
+        elif compare:
+            with chat_container:
+                slots = {endpoint: column.empty() for endpoint, column in zip(endpoints, st.columns(len(endpoints)))}
             
-            payload = {
-                "message": user_input,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "conversation_history": [
-                    {"role": m["role"], "content": m["content"]}
-                    for m in st.session_state.messages[:-1]  # Exclude the just-added user message
-                ]
-            }
+            def show_result(result):
+                slots[result.endpoint].markdown(
+                    bot_message_html(escape_content(result_text(result)), html.escape(result.endpoint)),
+                    unsafe_allow_html=True
+                )
             
-            # Call backend API
-            response = requests.post(
-                st.session_state.api_endpoint,
-                json=payload,
-                headers=headers,
-                timeout=30
+            def show_position(position):
+                for slot in slots.values():
+                    slot.markdown(bot_message_html(queue_message(position), "waiting..."), unsafe_allow_html=True)
+            
+            with st.spinner(f"🤖 Asking {len(endpoints)} backends..."):
+                with get_admission().admit(on_wait=show_position):
+                    results = {r.endpoint: r for r in get_dispatcher().fan_out(endpoints, open_for, show_result)}
+            comparisons = {endpoint: result_text(results[endpoint]) for endpoint in endpoints}
+            served_by = endpoints[0]
+            reply = results[served_by].reply
+            bot_response = comparisons[served_by]
+            completed = results[served_by].ok
+        else:
+            def produce(flight):
+                # Background thread: wait our turn, then call backend API over the shared
+                # keep-alive pool, hedging to replicas if slow
+                with get_admission().admit(on_wait=flight.set_position):
+                    result = get_dispatcher().hedged(endpoints, open_for)
+                    if result.error is not None:
+                        raise result.error
+                    flight.meta.update(reply=result.reply, served_by=result.endpoint, hedged=result.hedged)
+                    if result.ok:
+                        text = []
+                        for delta in result.deltas():
+                            text.append(delta)
+                            flight.publish(delta)
+                        if use_cache and text:
+                            get_response_cache().put(reply_key, "".join(text))
+            
+            # Identical turns already in flight (e.g. the quick-start prompts) share one backend call
+            key = request_key(
+                endpoints, dispatch_mode, response_mode, st.session_state.api_key,
+                [syncs[endpoint].conversation_id for endpoint in endpoints] if sync_mode == "Delta" else None,
+                [(m["role"], m["content"]) for m in turn_messages], temperature, max_tokens
             )
+            flight, started_here = get_coalescer().join(key, produce)
+            coalesced = not started_here
+            
+            with chat_container:
+                placeholder = st.empty()
+            placeholder.markdown(bot_message_html("▌", "typing..."), unsafe_allow_html=True)
             
-            if response.status_code == 200:
-                bot_response = response.json().get("response", "No response received")
+            def show_position(position):
+                placeholder.markdown(bot_message_html(queue_message(position), "waiting..."), unsafe_allow_html=True)
+            
+            for delta in flight.subscribe(on_wait=show_position):
+                bot_response += delta
+                bot_html += escape_content(delta)
+                placeholder.markdown(bot_message_html(bot_html + " ▌", "typing..."), unsafe_allow_html=True)
+            reply = flight.meta["reply"]
+            served_by = flight.meta["served_by"]
+            hedged = flight.meta["hedged"]
+            
+            if reply.ok:
+                bot_response = bot_response or "No response received"
+                completed = True
             else:
-                bot_response = f"Error: API returned status code {response.status_code}"
-                
-        except requests.exceptions.ConnectionError:
-            bot_response = "⚠️ Could not connect to backend. Please check your API endpoint."
-        except requests.exceptions.Timeout:
-            bot_response = "⚠️ Request timed out. The backend took too long to respond."
-        except Exception as e:
-            bot_response = f"⚠️ Error: {str(e)}"
+                bot_response = f"Error: API returned status code {reply.status_code}"
+            
+    except QueueFull:
+        bot_response += "\n\n⚠️ The assistant is at capacity right now. Please try again in a moment."
+    except requests.exceptions.ConnectionError:
+        bot_response += "\n\n⚠️ Could not connect to backend. Please check your API endpoint."
+    except requests.exceptions.Timeout:
+        bot_response += "\n\n⚠️ Request timed out. The backend took too long to respond."
+    except Exception as e:
+        bot_response += f"\n\n⚠️ Error: {str(e)}"
     
     # Add bot response to chat
-    bot_timestamp = datetime.now().strftime("%I:%M %p")
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": bot_response,
-        "timestamp": bot_timestamp
-    })
-    # Rerun to display the new message
-    st.rerun()
+    bot_message = add_message(
+        "assistant",
+        bot_response.strip(),
+        ttfb_ms=reply.ttfb * 1000 if reply is not None and reply.ttfb is not None else None,
+        total_ms=reply.total * 1000 if reply is not None and reply.total is not None else None,
+        request_bytes=reply.request_bytes if reply is not None else None,
+        served_by=served_by,
+        hedged=hedged,
+        coalesced=coalesced,
+        cached=from_cache,
+        comparisons=comparisons
+    )
+    # Only the backend whose reply we kept holds the same messages we do (a shared reply
+    # belongs to another session's conversation, a cached one never reached a backend);
+    # everything else full-syncs next turn
+    for endpoint in endpoints:
+        if completed and sync_mode == "Delta" and endpoint == served_by and not coalesced:
+            syncs[endpoint].acknowledge(reply.conversation_id, store.count(conversation_id))
+        else:
+            syncs[endpoint].reset()
+    # Swap the streamed bubble for the finished one (timing footer included) instead of
+    # rerunning, which would format and send the whole transcript again
+    if comparisons is None:
+        for slot in slots.values():
+            slot.empty()
+        if placeholder is None:
+            with chat_container:
+                placeholder = st.empty()
+        placeholder.markdown(message_html(bot_message), unsafe_allow_html=True)
 
 # Welcome message if no messages yet
-if len(st.session_state.messages) == 0:
+if store.count(conversation_id) == 0:
     st.info("👋 Welcome! Start a conversation by typing a message below.")
     
     # Quick start examples
     st.subheader("Try these examples:")
     col1, col2, col3 = st.columns(3)
     
+    # The click stores the prompt before the rerun, so the turn goes through admission
+    # and coalescing like typed input (identical clicks from many users share one call)
     with col1:
-        if st.button("💡 Tell me a joke"):
-            st.session_state.messages.append({
-                "role": "user",
-                "content": "Tell me a joke",
-                "timestamp": datetime.now().strftime("%I:%M %p")
-            })
-            st.rerun()
+        st.button("💡 Tell me a joke", on_click=queue_prompt, args=("Tell me a joke",))
     
     with col2:
-        if st.button("📚 Explain AI"):
-            st.session_state.messages.append({
-                "role": "user",
-                "content": "Explain artificial intelligence in simple terms",
-                "timestamp": datetime.now().strftime("%I:%M %p")
-            })
-            st.rerun()
+        st.button("📚 Explain AI", on_click=queue_prompt,
+                  args=("Explain artificial intelligence in simple terms",))
     
     with col3:
-        if st.button("🎯 Help me brainstorm"):
-            st.session_state.messages.append({
-                "role": "user",
-                "content": "Help me brainstorm ideas for a project",
-                "timestamp": datetime.now().strftime("%I:%M %p")
-            })
-            st.rerun()
-
-
-    
-
-        
-        
-
-
-
-
-
-
-
+        st.button("🎯 Help me brainstorm", on_click=queue_prompt,
+                  args=("Help me brainstorm ideas for a project",))
@@ -21,6 +21,18 @@ import time
 import json
 import os
 import base64
+from functools import partial
+
+from admission import AdmissionController, QueueFull, RequestCoalescer, queue_message, request_key
+from chat_history import (
+    conversation_metrics, new_conversation, open_conversation, render_chat_history, render_history_search
+)
+from context_retrieval import DEFAULT_TOP_K, ContextIndex, DocumentIndex, format_context
+from conversation_store import ConversationStore
+from document_registry import DocumentRegistry
+from pdf_extract import PdfExtractor
+from response_cache import ResponseCache, cache_key, cacheable, replay
+from stream_render import StreamRenderer
 
 # Optional imports (used only if available)
 try:
@@ -37,54 +49,69 @@ except Exception:
 # -------------------- Utilities --------------------
 
 def init_state():
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
+    open_conversation(get_conversation_store(), 'app02')
     if 'context_documents' not in st.session_state:
-        st.session_state.context_documents = []
+        st.session_state.context_documents = DocumentRegistry()
     if 'streaming' not in st.session_state:
         st.session_state.streaming = False
+    if 'context_index' not in st.session_state:
+        st.session_state.context_index = ContextIndex(st.session_state.context_documents.text)
+    if 'last_context' not in st.session_state:
+        st.session_state.last_context = []
 
 
-def add_message(role: str, content: str, attachments: List[Dict[str, Any]] = None):
-    st.session_state.messages.append({
-        'role': role,
-        'content': content,
-        'time': time.time(),
-        'attachments': attachments or []
-    })
+def add_message(role: str, content: str, attachments: List[Dict[str, Any]] = None, **fields) -> Dict[str, Any]:
+    """fields: extra stored details, e.g. served_by and total_ms for replies (used by the chat statistics)."""
+    store = get_conversation_store()
+    metrics = conversation_metrics(store, st.session_state.conversation_id)
+    message = store.append(st.session_state.conversation_id, role, content, attachments=attachments or [], **fields)
+    metrics.record(message)
+    return message
 
 
 def clear_chat():
-    st.session_state.messages = []
-    st.session_state.context_documents = []
+    new_conversation(get_conversation_store(), 'app02')
+    st.session_state.context_documents.close()
+    st.session_state.context_documents = DocumentRegistry(st.session_state.context_documents.memory_cap)
+    st.session_state.context_index = ContextIndex(st.session_state.context_documents.text)
+    st.session_state.last_context = []
 
 
-def download_chat_json():
+def download_chat_json(store: ConversationStore, conversation_id: int, documents: DocumentRegistry):
     data = {
-        'messages': st.session_state.messages,
-        'context_documents': st.session_state.context_documents,
+        'messages': list(store.messages(conversation_id)),
+        'context_documents': documents.export(),
         'meta': {'exported_at': time.time()}
     }
     return json.dumps(data, indent=2)
 
 
-def read_uploaded_file(uploaded_file) -> str:
+@st.cache_resource
+def get_conversation_store() -> ConversationStore:
+    """Shared by every session; each session keeps only its conversation id."""
+    return ConversationStore()
+
+
+@st.cache_resource
+def get_pdf_extractor() -> PdfExtractor:
+    """Shared worker pool and extracted-text cache for every session."""
+    return PdfExtractor()
+
+
+def read_uploaded_file(uploaded_file, on_progress=None, digest=None) -> str:
+    """on_progress(pages_done, total_pages, leading_text) is called as PDF pages are extracted."""
     name = uploaded_file.name.lower()
     if name.endswith('.txt') or name.endswith('.md'):
         content = uploaded_file.getvalue().decode('utf-8')
         return content
     if name.endswith('.pdf') and PyPDF2 is not None:
         try:
-            reader = PyPDF2.PdfReader(uploaded_file)
-            pages = []
-            for p in reader.pages:
-                pages.append(p.extract_text() or '')
-            return '\n\n'.join(pages)
+            return get_pdf_extractor().extract_text(uploaded_file, on_progress, digest)
         except Exception as e:
             return f"[unreadable pdf: {e}]"
-    # Fallback: binary to base64 (for images or unknown types)
-    b64 = base64.b64encode(uploaded_file.getvalue()).decode('utf-8')
-    return f"[base64:{uploaded_file.name}:{b64[:200]}...]"
+    # Fallback: base64 preview (for images or unknown types); 150 bytes encode to the 200 characters kept
+    b64 = base64.b64encode(uploaded_file.getbuffer()[:150]).decode('utf-8')
+    return f"[base64:{uploaded_file.name}:{b64}...]"
 
 
 # -------------------- LLM Backend (Optional) --------------------
@@ -94,17 +121,24 @@ class LocalEchoLLM:
 
     @staticmethod
     def generate(system_prompt: str, history: List[Dict[str, str]], temperature: float = 0.0):
+        """Yields the reply as deltas of a few words each."""
         last_user = next((m['content'] for m in reversed(history) if m['role'] == 'user'), '')
         reply = f"Echoing: {last_user}\n\n(You can plug an OpenAI key in the sidebar to enable real models.)"
-        for i in range(1, len(reply.split()) + 1, 6):
-            yield ' '.join(reply.split()[:i])
+        words = list(replay(reply))
+        for i in range(0, len(words), 6):
+            yield ''.join(words[i:i + 6])
             time.sleep(0.05)
-        yield reply
 
 
-def openai_stream_response(api_key: str, model: str, system_prompt: str, history: List[Dict[str, str]], temperature: float = 0.0):
-    """Streams response tokens from OpenAI ChatCompletion API."""
+def openai_stream_response(api_key: str, model: str, system_prompt: str, history: List[Dict[str, str]], temperature: float = 0.0,
+                           status: Dict[str, Any] = None):
+    """Streams response deltas from OpenAI ChatCompletion API.
+
+    status['fallback'] is set when the local echo answered instead.
+    """
     if not OPENAI_AVAILABLE:
+        if status is not None:
+            status['fallback'] = True
         yield from LocalEchoLLM.generate(system_prompt, history, temperature)
         return
 
@@ -126,24 +160,40 @@ def openai_stream_response(api_key: str, model: str, system_prompt: str, history
             stream=True,
         )
 
-        collected = ''
         for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                collected += chunk.choices[0].delta.content
-                yield collected
-        
-        yield collected
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     except Exception as e:
+        if status is not None:
+            status['fallback'] = True
         yield from LocalEchoLLM.generate(system_prompt, history, temperature)
 
 
+@st.cache_resource
+def get_admission() -> AdmissionController:
+    """Process-wide queue and rate limit shared by every chat session."""
+    return AdmissionController()
+
+
+@st.cache_resource
+def get_coalescer() -> RequestCoalescer:
+    return RequestCoalescer()
+
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    return ResponseCache()
+
+
 # -------------------- Streamlit UI --------------------
 
 st.set_page_config(page_title="Streamlit Chatbot UI", layout="wide")
 init_state()
 
-# Sidebar
-with st.sidebar:
+# Sidebar: a fragment, so changing a setting reruns only the sidebar and never
+# re-renders the transcript. A full run (e.g. a new turn) returns the settings.
+@st.fragment
+def sidebar_settings():
     st.title("Chatbot Settings")
     api_key_input = st.text_input("OpenAI API Key (optional)", type='password')
     if api_key_input:
@@ -151,6 +201,10 @@ with st.sidebar:
 
     model = st.selectbox("Model", options=["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo"], index=0)
     temp = st.slider("Temperature", min_value=0.0, max_value=1.0, value=0.7, step=0.05)
+    top_k = st.slider("Context chunks per turn", min_value=0, max_value=10, value=DEFAULT_TOP_K,
+                      help="Only the most relevant excerpts of uploaded documents are added to each prompt")
+    use_cache = st.checkbox("Use response cache", value=True, help="Replay stored replies for identical prompts. Only replies at temperature 0 "
+                                 "are cached; above 0 every turn is sampled fresh")
 
     st.markdown("---")
     st.subheader("System prompt / Persona")
@@ -168,23 +222,74 @@ with st.sidebar:
         clear_chat()
         st.rerun()
 
-    export_json = download_chat_json()
+    # Built only when clicked, so spilled documents are not read back on every rerun
+    export_json = partial(download_chat_json, get_conversation_store(), st.session_state.conversation_id,
+                          st.session_state.context_documents)
     st.download_button("Download chat (JSON)", export_json, file_name="chat_export.json", mime='application/json')
+    render_history_search(get_conversation_store(), st.session_state.conversation_id)
 
     st.markdown("---")
     st.markdown("**Context documents**")
+    documents = st.session_state.context_documents
+    memory_mb = st.number_input("Context text kept in memory (MB)", min_value=0.0,
+                                value=documents.memory_cap / 1_000_000, step=1.0,
+                                help="Larger documents are moved to a disk cache and read back when needed")
+    documents.set_memory_cap(int(memory_mb * 1_000_000))
     uploaded = st.file_uploader("Upload files (txt, md, pdf) to include as context", accept_multiple_files=True, key='sidebar_uploader')
     if uploaded:
+        attached = False
         for f in uploaded:
-            # Check if already processed
-            if not any(d['name'] == f.name for d in st.session_state.context_documents):
-                text = read_uploaded_file(f)
-                st.session_state.context_documents.append({'name': f.name, 'text': text})
-                add_message('system', f"[Attached file: {f.name}]\n\n{text[:500]}...")
-        st.success(f"Total context files: {len(st.session_state.context_documents)}")
+            # Same content under any name is attached once
+            digest = documents.digest_for(f)
+            if digest not in documents:
+                progress = st.progress(0.0, text=f"Reading {f.name}...")
+                preview = st.empty()
+
+                def show_progress(done, total, leading_text, name=f.name):
+                    progress.progress(done / total, text=f"{name}: {done}/{total} pages")
+                    preview.caption(leading_text[:300])
+
+                text = read_uploaded_file(f, on_progress=show_progress, digest=digest)
+                progress.empty()
+                preview.empty()
+                # Index once on upload; later turns retrieve from it instead of re-reading the text
+                document_index = DocumentIndex(f.name, text)
+                st.session_state.context_index.add(digest, document_index)
+                documents.add(digest, f.name, text)
+                add_message('system', f"[Attached file: {f.name} — {len(document_index)} chunks indexed]")
+                attached = True
+        if attached:
+            # The transcript and document list live outside this fragment
+            st.rerun()
+        st.success(f"Total context files: {len(documents)}")
 
     st.markdown("---")
+    cache_stats = get_response_cache().stats()
+    st.caption(
+        f"Response cache: {cache_stats['hit_rate']:.0%} hit rate "
+        f"({cache_stats['hits']} hits, {cache_stats['misses']} misses)"
+    )
+    queue_stats = get_admission().stats()
+    st.caption(
+        f"Backend queue: {queue_stats['active']} running · {queue_stats['queued']} waiting · "
+        f"{get_coalescer().stats()['coalesced']} shared replies"
+    )
+    chat_metrics = conversation_metrics(get_conversation_store(), st.session_state.conversation_id)
+    latency = ", ".join(
+        f"{backend} p50 {stats['p50_ms'] / 1000:.1f} s / p95 {stats['p95_ms'] / 1000:.1f} s"
+        for backend, stats in chat_metrics.latency_summary().items()
+    )
+    st.caption(
+        f"This chat: {chat_metrics.total} messages · ~{chat_metrics.total_tokens:,} tokens"
+        + (f" · {latency}" if latency else "")
+    )
     st.caption("Demo chatbot UI. Connect to other LLM providers by modifying the backend.")
+    return api_key_input, model, temp, top_k, use_cache, system_prompt
+
+
+with st.sidebar:
+    api_key_input, model, temp, top_k, use_cache, system_prompt = sidebar_settings()
+    use_cache = use_cache and cacheable(temp)
 
 # Main layout
 col1, col2 = st.columns([3, 1])
@@ -193,54 +298,105 @@ with col1:
     st.header("Chat")
 
     # Display chat messages
-    if not st.session_state.messages:
-        st.info("Start the conversation by typing a message below.")
+    def render_message(msg):
+        role = msg['role']
+        content = msg['content']
+        if role in ['user', 'assistant']:
+            with st.chat_message(role):
+                st.markdown(content)
+        else:
+            st.markdown(f"**{role}**: {content}")
+
+    store = get_conversation_store()
+    conversation_id = st.session_state.conversation_id
+    intro = st.empty()
+    if not store.count(conversation_id):
+        intro.info("Start the conversation by typing a message below.")
     else:
-        for msg in st.session_state.messages:
-            role = msg['role']
-            content = msg['content']
-            if role in ['user', 'assistant']:
-                with st.chat_message(role):
-                    st.markdown(content)
-            else:
-                st.markdown(f"**{role}**: {content}")
+        # Only the newest messages are read and rendered; older ones load on demand
+        render_chat_history(store, conversation_id, render_message)
 
     # Input area
     user_input = st.chat_input("Type a message...")
     
     if user_input:
-        # Add user message
-        add_message('user', user_input)
+        # Add the user message and draw it; the turn ends without a rerun,
+        # so this is the only time it is drawn in this run
+        intro.empty()
+        render_message(add_message('user', user_input))
 
         # Prepare history for LLM
         history_for_llm = [
             {'role': m['role'], 'content': m['content']} 
-            for m in st.session_state.messages 
+            for m in store.messages(conversation_id)
             if m['role'] in ['user', 'assistant']
         ]
 
+        # Pull only the most relevant document excerpts into this turn's prompt
+        hits = st.session_state.context_index.search(user_input, top_k)
+        st.session_state.last_context = [(h.document, h.chunk_no, h.score) for h in hits]
+        turn_system_prompt = f"{system_prompt}\n\n{format_context(hits)}" if hits else system_prompt
+
         # Streaming response
         with st.chat_message('assistant'):
             message_placeholder = st.empty()
             
             # Choose backend: OpenAI if key provided else local echo
-            if api_key_input and OPENAI_AVAILABLE:
-                stream_gen = openai_stream_response(api_key_input, model, system_prompt, history_for_llm, temperature=temp)
+            use_openai = bool(api_key_input and OPENAI_AVAILABLE)
+            backend_status = {}
+            if use_openai:
+                stream_gen = openai_stream_response(api_key_input, model, turn_system_prompt, history_for_llm, temperature=temp,
+                                                    status=backend_status)
             else:
-                stream_gen = LocalEchoLLM.generate(system_prompt, history_for_llm, temperature=temp)
-
-            assistant_text = ''
-            for partial in stream_gen:
-                assistant_text = partial
-                message_placeholder.markdown(assistant_text + '▌')
-            
-            message_placeholder.markdown(assistant_text)
-            add_message('assistant', assistant_text)
+                stream_gen = LocalEchoLLM.generate(turn_system_prompt, history_for_llm, temperature=temp)
+            response_key = cache_key(model if use_openai else 'local-echo', turn_system_prompt, history_for_llm, temp, None)
+
+            def produce(flight):
+                # Runs on a background thread once admitted; publishes each delta
+                with get_admission().admit(on_wait=flight.set_position):
+                    parts = []
+                    for delta in stream_gen:
+                        parts.append(delta)
+                        flight.publish(delta)
+                    reply = ''.join(parts)
+                    fallback = backend_status.get('fallback', False)
+                    # Published on the flight: sessions that joined it never ran this produce
+                    flight.meta['served_by'] = model if use_openai and not fallback else 'local-echo'
+                    if use_cache and reply and not fallback:
+                        get_response_cache().put(response_key, reply)
+
+            turn_started = time.time()
+            cached = get_response_cache().get(response_key) if use_cache else None
+            if cached is not None:
+                # Replayed as a stream of deltas, like a live reply
+                deltas = replay(cached)
+            else:
+                # Identical requests already in flight share one backend call
+                key = request_key(model if use_openai else 'local-echo', api_key_input, turn_system_prompt, history_for_llm, temp)
+                flight, _ = get_coalescer().join(key, produce)
+                deltas = flight.subscribe(on_wait=lambda position: message_placeholder.markdown(queue_message(position)))
+
+            # Deltas are batched: the placeholder is redrawn at most every 50 ms
+            renderer = StreamRenderer(message_placeholder)
+            served_by = None
+            try:
+                for delta in deltas:
+                    renderer.write(delta)
+                assistant_text = renderer.close()
+                if cached is not None:
+                    served_by = 'cache'
+                else:
+                    served_by = flight.meta['served_by']
+            except QueueFull:
+                assistant_text = "⚠️ The assistant is at capacity right now. Please try again in a moment."
+                message_placeholder.markdown(assistant_text)
+            add_message('assistant', assistant_text, served_by=served_by,
+                        total_ms=(time.time() - turn_started) * 1000 if served_by else None)
 
 with col2:
     st.header("Context & Tools")
     st.markdown("**Recent conversation**")
-    last_msgs = st.session_state.messages[-6:]
+    last_msgs = get_conversation_store().recent(st.session_state.conversation_id, 6)
     summary = '\n\n'.join([f"{m['role']}: {m['content'][:100]}..." for m in last_msgs]) or "No messages yet."
     st.code(summary, language='')
 
@@ -248,8 +404,12 @@ with col2:
     st.subheader("Context documents")
     if st.session_state.context_documents:
         for d in st.session_state.context_documents:
-            with st.expander(f"📄 {d['name']}"):
-                st.write(d['text'][:500] + "...")
+            with st.expander(f"📄 {d.name}"):
+                st.write(st.session_state.context_documents.preview(d.digest, 500) + "...")
+        if st.session_state.last_context:
+            st.caption("Excerpts used for the last answer: " + ", ".join(
+                f"{name} #{chunk_no + 1} ({score:.1f})" for name, chunk_no, score in st.session_state.last_context
+            ))
     else:
         st.info('No extra context documents uploaded')
 
@@ -257,15 +417,23 @@ with col2:
     st.subheader("Quick actions")
     if st.button('Export last 5 messages'):
         md = ''
-        for m in st.session_state.messages[-5:]:
+        for m in get_conversation_store().recent(st.session_state.conversation_id, 5):
             prefix = '### User' if m['role'] == 'user' else '### Assistant'
             md += f"{prefix}\n\n{m['content']}\n\n"
         st.download_button('Download .md', md, file_name='last_5_messages.md', mime='text/markdown')
 
     if st.button('Show session info'):
+        document_stats = st.session_state.context_documents.stats()
+        chat_metrics = conversation_metrics(get_conversation_store(), st.session_state.conversation_id)
         st.json({
-            'messages_count': len(st.session_state.messages),
-            'context_docs_count': len(st.session_state.context_documents),
+            'messages_count': chat_metrics.total,
+            'messages_by_role': dict(chat_metrics.messages),
+            'estimated_tokens': dict(chat_metrics.tokens),
+            'reply_latency': chat_metrics.latency_summary(),
+            'context_docs_count': document_stats['documents'],
+            'context_docs_on_disk': document_stats['spilled'],
+            'context_chars_in_memory': document_stats['resident_chars'],
+            'context_chunks_indexed': st.session_state.context_index.num_chunks,
             'streaming': st.session_state.streaming
         })
 
@@ -1,5 +1,8 @@
 import streamlit as st
 
+from chat_history import conversation_metrics, new_conversation, open_conversation, render_chat_history
+from conversation_store import ConversationStore
+
 # -----------------------------
 # Page Config
 # -----------------------------
@@ -12,25 +15,37 @@ st.set_page_config(
 # -----------------------------
 # Initialize Session State
 # -----------------------------
-if "messages" not in st.session_state:
-    st.session_state["messages"] = []
+@st.cache_resource
+def get_conversation_store() -> ConversationStore:
+    """Shared by every session; each session keeps only its conversation id."""
+    return ConversationStore()
+
+
+store = get_conversation_store()
+conversation_id = open_conversation(store, "app03")
 
 # -----------------------------
 # Sidebar
 # -----------------------------
-with st.sidebar:
+# A fragment, so widgets here rerun only the sidebar, not the transcript
+@st.fragment
+def sidebar():
     st.title("Navigation")
     st.markdown("Customize your chatbot here.")
     
     if st.button("New Chat", use_container_width=True):
-        st.session_state["messages"] = []
+        new_conversation(store, "app03")
         st.rerun()
     
     st.divider()
     
     # Display message count
-    message_count = len(st.session_state["messages"])
-    st.caption(f"💬 Messages: {message_count}")
+    metrics = conversation_metrics(store, st.session_state.conversation_id)
+    st.caption(f"💬 Messages: {metrics.total} · ~{metrics.total_tokens:,} tokens")
+
+
+with st.sidebar:
+    sidebar()
 
 # -----------------------------
 # Main Chat Interface
@@ -41,18 +56,22 @@ st.markdown("---")
 # -----------------------------
 # Display Chat History
 # -----------------------------
+def render_message(msg):
+    if msg["role"] == "user":
+        with st.chat_message("user", avatar="👤"):
+            st.markdown(msg["content"])
+    else:
+        with st.chat_message("assistant", avatar="🤖"):
+            st.markdown(msg["content"])
+
+
 chat_container = st.container()
 with chat_container:
-    if len(st.session_state["messages"]) == 0:
+    if store.count(conversation_id) == 0:
         st.info("👋 Start a conversation by typing a message below!")
     else:
-        for msg in st.session_state["messages"]:
-            if msg["role"] == "user":
-                with st.chat_message("user", avatar="👤"):
-                    st.markdown(msg["content"])
-            else:
-                with st.chat_message("assistant", avatar="🤖"):
-                    st.markdown(msg["content"])
+        # Only the newest messages are rendered; older ones load on demand
+        render_chat_history(store, conversation_id, render_message)
 
 # -----------------------------
 # User Input Box
@@ -61,19 +80,14 @@ user_input = st.chat_input("Send a message...")
 
 if user_input:
     # Store user message
-    st.session_state["messages"].append({
-        "role": "user",
-        "content": user_input
-    })
+    metrics = conversation_metrics(store, conversation_id)
+    metrics.record(store.append(conversation_id, "user", user_input))
     
     # Generate bot reply (placeholder logic)
     bot_reply = f"You said: **{user_input}**"
     
     # Store bot message
-    st.session_state["messages"].append({
-        "role": "assistant",
-        "content": bot_reply
-    })
+    metrics.record(store.append(conversation_id, "assistant", bot_reply))
     
     # Refresh to display new messages
     st.rerun()
\ No newline at end of file
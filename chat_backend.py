@@ -0,0 +1,235 @@
+"""
+Chat backend protocol for app01.py.
+
+A turn is sent as one POST. The backend may answer in any of these forms and
+the reply is read progressively where the format allows it:
+- text/event-stream: Server-Sent Events, one text delta per event, ended by
+  "data: [DONE]" or by the connection closing
+- application/x-ndjson: one JSON object per line
+- application/json: the original blocking format, {"response": "..."}
+- anything else (e.g. chunked text/plain): raw text as it arrives
+
+Each turn records time to first byte of reply text and total time. A reply
+read to its end (including past "data: [DONE]") hands its connection back to
+the keep-alive pool; one abandoned midway is closed instead.
+
+Delta sync: rather than resending the whole history every turn, the client
+can hold a conversation on the backend. The first turn is a full sync (the
+legacy "message" + "conversation_history" payload with "conversation_id":
+null). The backend answers with an X-Conversation-Id header. Later turns send
+{"conversation_id", "base", "messages"}, where messages holds only what was
+added after the first `base` messages the backend already has. If the backend
+replies 409 or 410 (state lost or out of step), the turn is retried as a full
+sync. A backend that never returns an id just keeps receiving full syncs.
+local_backend.py implements the server side for offline testing.
+"""
+
+import json
+import time
+from typing import Iterator, List, Optional
+
+import requests
+
+RESPONSE_MODES = ["Streaming", "JSON"]
+SYNC_MODES = ["Delta", "Full history"]
+CONVERSATION_HEADER = "X-Conversation-Id"
+LOST_STATE_STATUSES = (409, 410)
+STREAM_ACCEPT = "text/event-stream, application/x-ndjson, application/json;q=0.5"
+DELTA_KEYS = ("token", "delta", "content", "response", "text")
+
+
+def _delta_from_json(data) -> str:
+    """Pull the text delta out of one streamed JSON object."""
+    if isinstance(data, str):
+        return data
+    if not isinstance(data, dict):
+        return ""
+    if data.get("choices"):  # OpenAI-style chunks
+        choice = data["choices"][0]
+        return (choice.get("delta") or {}).get("content") or choice.get("text") or ""
+    for key in DELTA_KEYS:
+        value = data.get(key)
+        if isinstance(value, str):
+            return value
+    return ""
+
+
+def _parse_data(data: str) -> str:
+    try:
+        return _delta_from_json(json.loads(data))
+    except ValueError:
+        return data
+
+
+def iter_sse(response: requests.Response) -> Iterator[str]:
+    data_lines = []
+    done = False
+    for line in response.iter_lines(decode_unicode=True):
+        if done:
+            continue  # read on to the end of the body so the connection can be reused
+        if line:
+            if line.startswith("data:"):
+                data_lines.append(line[5:].lstrip(" "))
+            continue
+        # Blank line dispatches the event
+        if not data_lines:
+            continue
+        data = "\n".join(data_lines)
+        data_lines = []
+        if data == "[DONE]":
+            done = True
+            continue
+        delta = _parse_data(data)
+        if delta:
+            yield delta
+    if data_lines and not done and data_lines != ["[DONE]"]:
+        delta = _parse_data("\n".join(data_lines))
+        if delta:
+            yield delta
+
+
+def iter_ndjson(response: requests.Response) -> Iterator[str]:
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            delta = _parse_data(line)
+            if delta:
+                yield delta
+
+
+def iter_deltas(response: requests.Response) -> Iterator[str]:
+    """Text deltas of a reply, in whatever format the backend chose."""
+    header = response.headers.get("Content-Type", "")
+    content_type = header.split(";")[0].strip().lower()
+    if "charset" not in header.lower():
+        # requests would fall back to ISO-8859-1 for text/*
+        response.encoding = "utf-8"
+    if content_type == "application/json":
+        yield response.json().get("response", "No response received")
+    elif content_type == "text/event-stream":
+        yield from iter_sse(response)
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        yield from iter_ndjson(response)
+    else:
+        for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+            if chunk:
+                yield chunk
+
+
+class ReplyStream:
+    """One backend turn: iterate it for text deltas; timings are filled in as it is read."""
+
+    def __init__(self, response: requests.Response, started: float, request_bytes: int = 0,
+                 resynced: bool = False):
+        self.response = response
+        self.started = started
+        self.request_bytes = request_bytes
+        self.resynced = resynced
+        self.ttfb: Optional[float] = None
+        self.total: Optional[float] = None
+
+    @property
+    def conversation_id(self) -> Optional[str]:
+        return self.response.headers.get(CONVERSATION_HEADER)
+
+    @property
+    def ok(self) -> bool:
+        return self.response.status_code == 200
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for delta in iter_deltas(self.response):
+                if self.ttfb is None:
+                    self.ttfb = time.perf_counter() - self.started
+                yield delta
+        finally:
+            self.total = time.perf_counter() - self.started
+            # A body read to the end has already gone back to the pool; one abandoned
+            # midway (hedge loser, error) is dropped rather than drained
+            self.response.close()
+
+
+class ConversationSync:
+    """Client side of delta sync: the backend's conversation id and how many messages it holds."""
+
+    def __init__(self):
+        self.conversation_id: Optional[str] = None
+        self.synced = 0
+
+    def reset(self):
+        self.conversation_id = None
+        self.synced = 0
+
+    def payload(self, messages: List[dict]) -> dict:
+        if self.conversation_id is None:
+            return full_payload(messages, conversation_id=None)
+        return {
+            "conversation_id": self.conversation_id,
+            "base": self.synced,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages[self.synced:]],
+        }
+
+    def acknowledge(self, conversation_id: Optional[str], count: int):
+        """Record a completed turn; count is the message total including the reply."""
+        self.conversation_id = conversation_id
+        self.synced = count if conversation_id else 0
+
+
+def full_payload(messages: List[dict], **extra) -> dict:
+    """The legacy payload: the latest user message plus everything before it."""
+    return {
+        "message": messages[-1]["content"],
+        "conversation_history": [{"role": m["role"], "content": m["content"]} for m in messages[:-1]],
+        **extra,
+    }
+
+
+def open_reply(client, endpoint: str, payload: dict, headers: dict, streaming: bool = True,
+               timeout: float = 30) -> ReplyStream:
+    """POST a turn and return as soon as the response headers arrive."""
+    headers = {**headers, "Content-Type": "application/json"}
+    if streaming:
+        payload = {**payload, "stream": True}
+        headers["Accept"] = STREAM_ACCEPT
+    body = json.dumps(payload).encode("utf-8")
+    started = time.perf_counter()
+    response = client.post(endpoint, data=body, headers=headers, timeout=timeout, stream=streaming)
+    return ReplyStream(response, started, request_bytes=len(body))
+
+
+def open_turn(client, endpoint: str, messages: List[dict], options: dict, headers: dict,
+              sync: Optional[ConversationSync] = None, streaming: bool = True,
+              timeout: float = 30) -> ReplyStream:
+    """Send the turn ending in messages[-1], as a delta when sync allows it."""
+    if sync is None:
+        return open_reply(client, endpoint, {**full_payload(messages), **options}, headers, streaming, timeout)
+    delta = sync.conversation_id is not None
+    reply = open_reply(client, endpoint, {**sync.payload(messages), **options}, headers, streaming, timeout)
+    if delta and reply.status_code in LOST_STATE_STATUSES:
+        # Backend lost (or disagrees about) the conversation: start over with a full sync
+        reply.response.close()
+        sync.reset()
+        reply = open_reply(client, endpoint, {**sync.payload(messages), **options}, headers, streaming, timeout)
+        reply.resynced = True
+    return reply
+
+
+def format_timing(message: dict) -> str:
+    """' · first token 120 ms · 1.4 s · 312 B sent' (plus hedge/cache notes) for a bot message, else ''."""
+    parts = []
+    if message.get("total_ms") is not None:
+        if message.get("ttfb_ms") is not None:
+            parts.append(f"first token {message['ttfb_ms']:.0f} ms")
+        parts.append(f"{message['total_ms'] / 1000:.1f} s")
+    if message.get("request_bytes"):
+        parts.append(f"{message['request_bytes']:,} B sent")
+    if message.get("hedged"):
+        parts.append(f"hedged to {message['served_by']}")
+    if message.get("coalesced"):
+        parts.append("shared reply")
+    if message.get("cached"):
+        parts.append("cached reply")
+    return " · " + " · ".join(parts) if parts else ""
@@ -0,0 +1,193 @@
+"""
+Multi-backend dispatch for app01.py.
+
+Hedged: the turn goes to the primary endpoint. If no reply text has arrived
+within that endpoint's recent p95 time-to-first-token, the same turn is sent
+to the next endpoint, and so on. The first backend to start answering wins
+and the others are closed as soon as they return. A backend that fails
+outright is hedged immediately rather than after the delay.
+
+Compare: the turn is fanned out to every endpoint at once and each reply is
+handed back as it completes.
+
+The dispatcher runs on asyncio. Blocking calls on the shared pooled client
+run in a thread pool, so concurrent backends still reuse keep-alive
+connections.
+"""
+
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from chat_backend import ReplyStream
+
+DISPATCH_MODES = ["Single", "Hedged", "Compare"]
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 10
+DEFAULT_HEDGE_DELAY = 2.0
+
+
+class LatencyTracker:
+    """Rolling time-to-first-token samples per endpoint."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._samples[endpoint].append(seconds)
+
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples.get(endpoint, ()))
+        return float(np.percentile(samples, q)) if samples else None
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """p95 once there are enough samples; a fixed delay before that."""
+        with self._lock:
+            enough = len(self._samples.get(endpoint, ())) >= MIN_SAMPLES
+        return self.percentile(endpoint, 95) if enough else DEFAULT_HEDGE_DELAY
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            endpoints = list(self._samples)
+        return {
+            endpoint: {
+                'p50_ttft_ms': round(1000 * self.percentile(endpoint, 50), 1),
+                'p95_ttft_ms': round(1000 * self.percentile(endpoint, 95), 1),
+            }
+            for endpoint in endpoints
+        }
+
+
+class DispatchResult:
+    """Outcome of one backend for one turn, primed with the first text delta."""
+
+    def __init__(self, endpoint: str, reply: Optional[ReplyStream] = None, error: Optional[BaseException] = None):
+        self.endpoint = endpoint
+        self.reply = reply
+        self.error = error
+        self.hedged = False
+        self._first: Optional[str] = None
+        self._rest: Optional[Iterator[str]] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.reply is not None and self.reply.ok
+
+    def prime(self):
+        """Read up to the first delta; runs in a worker thread."""
+        self._rest = iter(self.reply)
+        self._first = next(self._rest, None)
+
+    def deltas(self) -> Iterator[str]:
+        if self._first is not None:
+            yield self._first
+        if self._rest is not None:
+            yield from self._rest
+
+    def text(self) -> str:
+        return "".join(self.deltas())
+
+    def close(self):
+        if self._rest is not None:
+            self._rest.close()
+        elif self.reply is not None:
+            self.reply.response.close()
+
+
+def _discard(future: Future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class ChatDispatcher:
+    """Process-wide: owns the worker threads and the latency history used for hedging."""
+
+    def __init__(self, max_workers: int = 16):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-dispatch")
+        self.latency = LatencyTracker()
+
+    def _prime(self, endpoint: str, open_fn: Callable[[str], ReplyStream], read_all: bool) -> DispatchResult:
+        started = time.perf_counter()
+        try:
+            result = DispatchResult(endpoint, open_fn(endpoint))
+            if not result.ok:
+                result.close()
+                return result
+            result.prime()
+            self.latency.record(endpoint, time.perf_counter() - started)
+            if read_all:
+                text = result.text()
+                result._first, result._rest = text, None
+        except Exception as e:
+            result = DispatchResult(endpoint, error=e)
+        return result
+
+    def _submit(self, endpoint: str, open_fn, read_all: bool = False):
+        future = self._executor.submit(self._prime, endpoint, open_fn, read_all)
+        return future, asyncio.wrap_future(future)
+
+    # -------------------- Hedged --------------------
+
+    async def _hedged(self, endpoints: List[str], open_fn) -> DispatchResult:
+        queue = list(endpoints)
+        in_flight: Dict[asyncio.Future, Future] = {}
+        failures: List[DispatchResult] = []
+
+        def launch():
+            future, waiter = self._submit(queue.pop(0), open_fn)
+            in_flight[waiter] = future
+
+        launch()
+        while in_flight:
+            timeout = self.latency.hedge_delay(endpoints[0]) if queue else None
+            done, _ = await asyncio.wait(list(in_flight), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for waiter in done:
+                in_flight.pop(waiter)
+            results = [waiter.result() for waiter in done]
+            winner = next((result for result in results if result.ok), None)
+            if winner is not None:
+                # Backends that finished together with the winner are closed now, the rest when they return
+                for result in results:
+                    if result is not winner:
+                        result.close()
+                for loser_waiter, loser in in_flight.items():
+                    loser_waiter.cancel()
+                    loser.add_done_callback(_discard)
+                winner.hedged = winner.endpoint != endpoints[0]
+                return winner
+            failures.extend(results)
+            if not in_flight and queue:
+                launch()
+        return failures[0]
+
+    def hedged(self, endpoints: List[str], open_fn: Callable[[str], ReplyStream]) -> DispatchResult:
+        """First backend to start answering; falls through failures. Blocks until then."""
+        return asyncio.run(self._hedged(endpoints, open_fn))
+
+    # -------------------- Compare --------------------
+
+    async def _fan_out(self, endpoints: List[str], open_fn, on_result) -> List[DispatchResult]:
+        waiters = [self._submit(endpoint, open_fn, read_all=True)[1] for endpoint in endpoints]
+        results = []
+        for next_done in asyncio.as_completed(waiters):
+            result = await next_done
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+        return results
+
+    def fan_out(self, endpoints: List[str], open_fn: Callable[[str], ReplyStream],
+                on_result: Optional[Callable[[DispatchResult], None]] = None) -> List[DispatchResult]:
+        """Send to every endpoint concurrently; on_result runs in the calling thread as each finishes."""
+        return asyncio.run(self._fan_out(endpoints, open_fn, on_result))
@@ -0,0 +1,131 @@
+"""
+Windowed chat transcript shared by app01.py, app02.py and app03.py.
+
+Only the newest messages are read from the conversation store and rendered.
+Older ones stay hidden behind a button that loads one more window at a time.
+The transcript is a fragment, so loading earlier messages reruns only the
+transcript. The apps keep their sidebars in fragments too, so changing a
+setting never re-renders the transcript. A full rerun, such as after a new
+turn, renders it once.
+
+The session holds just its conversation id, the window size and its running
+chat statistics. The page URL carries the conversation's unguessable token,
+so a refresh resumes the chat; a token from another app or an unknown one
+starts a new chat.
+
+The sidebar search box queries the store's full-text index, in this chat or
+across the chats this session owns: the ones it started or opened by token.
+Each hit links to its conversation.
+"""
+
+import datetime
+import re
+from typing import Any, Callable, Dict
+
+import streamlit as st
+
+from chat_metrics import ChatMetrics
+from conversation_store import HIGHLIGHT_END, HIGHLIGHT_START, ConversationStore
+
+HISTORY_WINDOW = 30
+CONVERSATION_PARAM = "conversation"
+SEARCH_RESULTS = 10
+
+_MARKDOWN_SPECIAL = re.compile(r'([\\`*_{}\[\]()#+\-.!|<>~$])')
+
+
+def open_conversation(store: ConversationStore, app: str) -> int:
+    """This session's conversation id: from session state, else from the URL, else a new one."""
+    if "conversation_id" not in st.session_state:
+        token = st.query_params.get(CONVERSATION_PARAM, "")
+        conversation_id = store.resolve(token, app) if token else None
+        if conversation_id is not None:
+            st.session_state.conversation_id = conversation_id
+            _own(conversation_id)
+        else:
+            new_conversation(store, app)
+    return st.session_state.conversation_id
+
+
+def _own(conversation_id: int):
+    st.session_state.setdefault("owned_conversations", []).append(conversation_id)
+
+
+def new_conversation(store: ConversationStore, app: str) -> int:
+    """Start an empty conversation; the old one stays in the store."""
+    st.session_state.conversation_id, token = store.create(app)
+    st.query_params[CONVERSATION_PARAM] = token
+    _own(st.session_state.conversation_id)
+    reset_history_window()
+    return st.session_state.conversation_id
+
+
+def conversation_metrics(store: ConversationStore, conversation_id: int) -> ChatMetrics:
+    """Running statistics of the conversation, built from the store only when out of step with it."""
+    metrics = st.session_state.get("chat_metrics")
+    if (metrics is None or metrics.conversation_id != conversation_id
+            or metrics.total != store.count(conversation_id)):
+        metrics = st.session_state.chat_metrics = ChatMetrics.from_messages(
+            conversation_id, store.messages(conversation_id)
+        )
+    return metrics
+
+
+def _show_earlier(limit_key: str, window: int):
+    st.session_state[limit_key] += window
+
+
+def reset_history_window(key: str = "history"):
+    """Collapse the transcript back to the newest window (e.g. on a new chat)."""
+    st.session_state.pop(f"{key}_limit", None)
+
+
+@st.fragment
+def render_chat_history(store: ConversationStore, conversation_id: int,
+                        render_message: Callable[[Dict[str, Any]], None],
+                        window: int = HISTORY_WINDOW, key: str = "history"):
+    limit_key = f"{key}_limit"
+    if limit_key not in st.session_state:
+        st.session_state[limit_key] = window
+    messages = store.recent(conversation_id, st.session_state[limit_key])
+    hidden = store.count(conversation_id) - len(messages)
+    if hidden:
+        st.button(
+            f"⬆️ Show {min(window, hidden)} earlier messages ({hidden} hidden)",
+            key=f"{key}_earlier",
+            on_click=_show_earlier,
+            args=(limit_key, window),
+            use_container_width=True
+        )
+    for message in messages:
+        render_message(message)
+
+
+def _snippet_markdown(snippet: str) -> str:
+    text = _MARKDOWN_SPECIAL.sub(r'\\\1', ' '.join(snippet.split()))
+    return text.replace(HIGHLIGHT_START, '**').replace(HIGHLIGHT_END, '**')
+
+
+def render_history_search(store: ConversationStore, conversation_id: int, key: str = "search"):
+    """Search box with ranked, highlighted hits. Call it inside the sidebar fragment."""
+    if not store.searchable:
+        return
+    query = st.text_input("🔎 Search chat history", key=f"{key}_query", placeholder="words or pref*")
+    scope = st.radio("Search in", ["This chat", "My chats"], horizontal=True, key=f"{key}_scope",
+                     label_visibility="collapsed")
+    if not query.strip():
+        return
+    if scope == "This chat":
+        conversation_ids = [conversation_id]
+    else:
+        conversation_ids = st.session_state.get("owned_conversations", [conversation_id])
+    hits = store.search(query, conversation_ids, limit=SEARCH_RESULTS)
+    if not hits:
+        st.caption("No matches.")
+    for hit in hits:
+        when = datetime.datetime.fromtimestamp(hit["created_at"]).strftime("%Y-%m-%d %H:%M")
+        source = (
+            "this chat" if hit["conversation_id"] == conversation_id
+            else f"[chat #{hit['conversation_id']}](?{CONVERSATION_PARAM}={hit['token']})"
+        )
+        st.markdown(f"**{hit['role']}** · {when} · {source}  \n{_snippet_markdown(hit['snippet'])}")
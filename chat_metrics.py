@@ -0,0 +1,103 @@
+"""
+Per-session chat statistics for app01.py, app02.py and app03.py.
+
+Counters are updated as each message is appended, instead of being
+recomputed from the whole history on every rerun:
+- messages per role
+- estimated tokens per role (about 4 characters per token; no tokenizer)
+- reply latency per backend, as a histogram over fixed log-spaced buckets
+
+Reading any statistic is O(1) in the length of the conversation. p50/p95 are
+read from the histogram to within half a bucket (about 12%). That is plenty for
+a sidebar, and memory stays constant however many replies there are.
+
+The metrics are built once from the stored conversation when a session
+opens it. They are rebuilt only if the store holds messages this session
+did not record, e.g. the same conversation open in a second tab.
+"""
+
+import bisect
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+# Bucket upper edges: 10 ms growing by 25% per bucket, up to about 9 minutes
+LATENCY_EDGES_MS: List[float] = [10 * 1.25 ** i for i in range(50)]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class LatencyHistogram:
+    """Fixed log-spaced buckets; a quantile is the geometric middle of the bucket it falls in."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_EDGES_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        self.buckets[bisect.bisect_left(LATENCY_EDGES_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i == len(LATENCY_EDGES_MS):
+                    return self.max_ms
+                upper = LATENCY_EDGES_MS[i]
+                middle = (LATENCY_EDGES_MS[i - 1] * upper) ** 0.5 if i else upper
+                return min(middle, self.max_ms)
+        return self.max_ms
+
+
+class ChatMetrics:
+    """Statistics of one conversation, updated one message at a time."""
+
+    def __init__(self, conversation_id: int):
+        self.conversation_id = conversation_id
+        self.messages: Counter = Counter()
+        self.tokens: Counter = Counter()
+        self.latency: Dict[str, LatencyHistogram] = {}
+
+    @classmethod
+    def from_messages(cls, conversation_id: int, messages: Iterable[Dict[str, Any]]) -> "ChatMetrics":
+        metrics = cls(conversation_id)
+        for message in messages:
+            metrics.record(message)
+        return metrics
+
+    def record(self, message: Dict[str, Any]):
+        """Count one appended message; replies carrying served_by and total_ms add a latency sample."""
+        role = message['role']
+        self.messages[role] += 1
+        self.tokens[role] += estimate_tokens(message['content'])
+        backend, total_ms = message.get('served_by'), message.get('total_ms')
+        if backend and total_ms is not None:
+            self.latency.setdefault(backend, LatencyHistogram()).add(total_ms)
+
+    @property
+    def total(self) -> int:
+        return sum(self.messages.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            backend: {
+                'replies': histogram.count,
+                'p50_ms': round(histogram.quantile(0.50), 1),
+                'p95_ms': round(histogram.quantile(0.95), 1),
+            }
+            for backend, histogram in self.latency.items()
+        }
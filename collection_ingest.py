@@ -0,0 +1,134 @@
+"""
+Bulk collection upload for the Collection Details tab in main.py.
+
+Collector files (CSV or Parquet) are read in Arrow record batches, never
+whole. Each chunk is reconciled against the bill ledger with vectorized
+lookups (a hash index on bill_no, then array comparisons), and the rows that
+pass are handed to the complaint store as one set-based write that dedups
+collection ids, accumulates payments per bill and recomputes each touched
+bill's Payment Status. Nothing loops over rows in Python.
+
+Required columns: collection_id, bill_no, amount.
+Optional columns: consumer_no, collection_date, collector_name.
+"""
+
+import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+CHUNK_ROWS = 50_000
+CSV_BLOCK_BYTES = 8 << 20
+REQUIRED_COLUMNS = ['collection_id', 'bill_no', 'amount']
+TEXT_COLUMNS = ['collection_id', 'bill_no', 'consumer_no', 'collection_date', 'collector_name']
+
+
+def iter_chunks(uploaded_file, name: str) -> Iterator[pd.DataFrame]:
+    """Yield the file as DataFrames of at most a few tens of thousands of rows."""
+    if name.lower().endswith('.parquet'):
+        for batch in pq.ParquetFile(uploaded_file).iter_batches(batch_size=CHUNK_ROWS):
+            yield batch.to_pandas()
+        return
+    reader = pacsv.open_csv(
+        uploaded_file,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+        convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in TEXT_COLUMNS}),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def normalize_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    missing = [c for c in REQUIRED_COLUMNS if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+    today = datetime.date.today().isoformat()
+    dates = pd.to_datetime(chunk['collection_date'], errors='coerce') if 'collection_date' in chunk else None
+    return pd.DataFrame({
+        'collection_id': chunk['collection_id'].fillna('').astype(str).str.strip(),
+        'consumer_no': chunk['consumer_no'].fillna('').astype(str).str.strip() if 'consumer_no' in chunk else '',
+        'bill_no': chunk['bill_no'].fillna('').astype(str).str.strip(),
+        'amount': pd.to_numeric(chunk['amount'], errors='coerce'),
+        'collection_date': dates.dt.strftime('%Y-%m-%d').fillna(today) if dates is not None else today,
+        'collector_name': chunk['collector_name'].fillna('').astype(str).str.strip() if 'collector_name' in chunk else '',
+    })
+
+
+class BillLedger:
+    """Bill amounts and due dates behind a hash index on bill_no."""
+
+    def __init__(self, bills: pd.DataFrame):
+        self.index = pd.Index(bills['bill_no'].astype(str))
+        self.consumer_no = bills['consumer_no'].astype(str).to_numpy()
+        self.amount = pd.to_numeric(bills['amount'], errors='coerce').to_numpy(dtype=float)
+        self.due_date = pd.to_datetime(bills['due_date'], errors='coerce').dt.strftime('%Y-%m-%d').fillna('').to_numpy()
+
+    def __len__(self):
+        return len(self.index)
+
+    def terms(self, bill_no: str) -> Optional[Tuple[str, float, str]]:
+        """(consumer_no, amount, due_date) of one bill, or None if it is not on file."""
+        pos = self.index.get_indexer([bill_no])[0]
+        if pos < 0:
+            return None
+        return str(self.consumer_no[pos]), float(self.amount[pos]), str(self.due_date[pos])
+
+    def reconcile(self, chunk: pd.DataFrame):
+        """Split a normalized chunk into rows to apply (with bill terms attached) and mismatches."""
+        pos = self.index.get_indexer(chunk['bill_no'])
+        known = pos >= 0
+        safe_pos = np.where(known, pos, 0)
+        bill_consumer = np.where(known, self.consumer_no[safe_pos], '')
+        consumer = chunk['consumer_no'].to_numpy(dtype=str)
+
+        issue = np.select(
+            [
+                chunk['collection_id'].eq('').to_numpy(),
+                chunk['collection_id'].duplicated().to_numpy(),
+                ~(chunk['amount'].to_numpy() > 0),
+                ~known,
+                (consumer != '') & (consumer != bill_consumer),
+            ],
+            ['missing collection id', 'duplicate in file', 'invalid amount', 'unknown bill', 'consumer mismatch'],
+            default='',
+        )
+        ok = issue == ''
+        mismatches = chunk.loc[~ok].assign(issue=issue[~ok])
+        rows = chunk.loc[ok].assign(
+            amount_due=self.amount[safe_pos[ok]],
+            due_date=self.due_date[safe_pos[ok]],
+        )
+        return rows, mismatches
+
+
+def ingest(uploaded_file, name: str, ledger: BillLedger, store, on_chunk=None) -> Dict:
+    """Stream a collector file through reconciliation into the store.
+
+    Returns totals and a DataFrame of every row that was not applied (or that
+    left its bill overpaid). on_chunk(rows_read) is called after each chunk.
+    """
+    summary = {'rows': 0, 'applied': 0, 'amount': 0.0, 'bills_updated': 0}
+    mismatches = []
+    for raw in iter_chunks(uploaded_file, name):
+        chunk = normalize_chunk(raw)
+        rows, rejected = ledger.reconcile(chunk)
+        mismatches.append(rejected)
+        if len(rows):
+            result = store.ingest_collections(rows)
+            duplicates = rows['collection_id'].isin(result['duplicates'])
+            mismatches.append(rows.loc[duplicates, chunk.columns].assign(issue='already recorded'))
+            applied = rows.loc[~duplicates]
+            summary['applied'] += len(applied)
+            summary['amount'] += float(applied['amount'].sum())
+            summary['bills_updated'] += result['bills_updated']
+            if len(result['overpaid']):
+                mismatches.append(result['overpaid'].assign(issue='overpaid'))
+        summary['rows'] += len(chunk)
+        if on_chunk is not None:
+            on_chunk(summary['rows'])
+    summary['mismatches'] = pd.concat(mismatches, ignore_index=True) if mismatches else pd.DataFrame()
+    return summary
@@ -0,0 +1,479 @@
+"""
+Durable store for operator-entered records: requests/complaints, collections,
+outage events and document metadata.
+
+Records go to SQLite in WAL mode. Sessions never write directly: they hand
+the write to a single writer thread and wait on a Future. The writer drains
+whatever has queued up and commits it as one transaction (group commit), so
+a burst of N submissions costs one fsync instead of N and sessions never
+fight over the database write lock. Reads use per-thread connections, which
+WAL lets run alongside the writer.
+
+Complaint numbers are derived from the row id ("RC00000042"), so looking one
+up from the top search box is a primary-key read.
+
+Open complaints form the pending-request queue, ordered by urgency (Critical
+first) and then age. The queue lives in a B-tree index on exactly that order:
+insert, resolve and reprioritize are O(log n) index updates, and pages are
+read with keyset pagination (seek past the last row of the previous page)
+rather than OFFSET, so page 1,000 costs the same as page 1.
+
+Each write also bumps the report rollups (report_rollups.py) in the same
+transaction, so reports never drift from the records behind them.
+"""
+
+import datetime
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import report_rollups as rollups
+from utility_store import DATA_DIR
+
+DB_PATH = os.environ.get("COMPLAINT_DB_PATH", os.path.join(DATA_DIR, "complaints.db"))
+COMPLAINT_PREFIX = "RC"
+PRIORITIES = ["Low", "Medium", "High", "Critical"]
+_COMPLAINT_ID = re.compile(r'[0-9]{1,18}')
+
+# 0 = most urgent. Stored as a virtual generated column so the queue index can seek on it
+URGENCY = "(CASE priority WHEN 'Critical' THEN 0 WHEN 'High' THEN 1 WHEN 'Medium' THEN 2 ELSE 3 END)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS complaints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    consumer_no TEXT,
+    complaint_type TEXT NOT NULL,
+    description TEXT,
+    priority TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Open',
+    created_at REAL NOT NULL,
+    resolved_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_complaints_consumer ON complaints(consumer_no);
+CREATE INDEX IF NOT EXISTS idx_complaints_status ON complaints(status);
+CREATE TABLE IF NOT EXISTS collections (
+    collection_id TEXT PRIMARY KEY,
+    consumer_no TEXT,
+    bill_no TEXT,
+    amount REAL NOT NULL,
+    collection_date TEXT NOT NULL,
+    collector_name TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bill_payments (
+    bill_no TEXT PRIMARY KEY,
+    amount_due REAL NOT NULL,
+    due_date TEXT,
+    paid_amount REAL NOT NULL,
+    payment_status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    consumer_no TEXT,
+    name TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_consumer ON documents(consumer_no);
+CREATE TABLE IF NOT EXISTS outage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    element TEXT NOT NULL,
+    area TEXT,
+    started_at REAL NOT NULL,
+    restored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS active_outages (
+    source TEXT NOT NULL,
+    element TEXT NOT NULL,
+    area TEXT,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (source, element)
+);
+CREATE TABLE IF NOT EXISTS affected_areas (
+    area TEXT PRIMARY KEY,
+    since REAL NOT NULL
+);
+""" + rollups.SCHEMA
+
+QUEUE_INDEX = "CREATE INDEX IF NOT EXISTS idx_complaints_queue ON complaints(status, urgency, created_at, id)"
+
+_INSERT = (
+    "INSERT INTO complaints (consumer_no, complaint_type, description, priority, created_at) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_COLLECTION_COLUMNS = ['collection_id', 'consumer_no', 'bill_no', 'amount', 'collection_date',
+                       'collector_name', 'amount_due', 'due_date']
+
+
+def format_complaint_no(complaint_id: int) -> str:
+    return f"{COMPLAINT_PREFIX}{complaint_id:08d}"
+
+
+def parse_complaint_no(complaint_no: str) -> Optional[int]:
+    """Accept "RC00000042", "rc42" or plain "42"; None if it is not a complaint number."""
+    text = (complaint_no or '').strip().upper()
+    if text.startswith(COMPLAINT_PREFIX):
+        text = text[len(COMPLAINT_PREFIX):]
+    # ASCII digits only (str.isdigit also accepts "²"), and short enough for a SQLite INTEGER
+    return int(text) if _COMPLAINT_ID.fullmatch(text) else None
+
+
+def _apply_collections(conn: sqlite3.Connection, values: List[Tuple], now: float) -> Dict:
+    """Insert staged collections, skipping ids already on file, and update their bills and rollups.
+
+    Shared by single entries and bulk uploads; values are tuples in _COLLECTION_COLUMNS order.
+    """
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS staging_collections "
+        "(collection_id TEXT, consumer_no TEXT, bill_no TEXT, amount REAL, collection_date TEXT, "
+        "collector_name TEXT, amount_due REAL, due_date TEXT)"
+    )
+    conn.execute("DELETE FROM staging_collections")
+    conn.executemany(f"INSERT INTO staging_collections VALUES ({','.join('?' * len(_COLLECTION_COLUMNS))})", values)
+    duplicates = [r[0] for r in conn.execute(
+        "SELECT collection_id FROM staging_collections WHERE collection_id IN (SELECT collection_id FROM collections)"
+    )]
+    conn.execute("DELETE FROM staging_collections WHERE collection_id IN (SELECT collection_id FROM collections)")
+    conn.execute(
+        "INSERT INTO collections (collection_id, consumer_no, bill_no, amount, collection_date, collector_name, created_at) "
+        "SELECT collection_id, consumer_no, bill_no, amount, collection_date, collector_name, ? FROM staging_collections",
+        (now,),
+    )
+    bills_updated = conn.execute(
+        "INSERT INTO bill_payments (bill_no, amount_due, due_date, paid_amount, payment_status, updated_at) "
+        "SELECT bill_no, MAX(amount_due), MAX(due_date), SUM(amount), 'Pending', ? "
+        "FROM staging_collections WHERE bill_no != '' GROUP BY bill_no "
+        "ON CONFLICT (bill_no) DO UPDATE SET paid_amount = paid_amount + excluded.paid_amount, "
+        "updated_at = excluded.updated_at",
+        (now,),
+    ).rowcount
+    conn.execute(
+        "UPDATE bill_payments SET payment_status = CASE "
+        "WHEN paid_amount >= amount_due - 0.005 THEN 'Paid' "
+        "WHEN due_date != '' AND due_date < date('now', 'localtime') THEN 'Overdue' "
+        "ELSE 'Pending' END "
+        "WHERE bill_no IN (SELECT bill_no FROM staging_collections)"
+    )
+    overpaid = conn.execute(
+        "SELECT bill_no, amount_due, paid_amount FROM bill_payments "
+        "WHERE bill_no IN (SELECT bill_no FROM staging_collections) AND paid_amount > amount_due + 0.005"
+    ).fetchall()
+    # One rollup bump per (collector, day), not per row
+    for collector, day, amount in conn.execute(
+        "SELECT collector_name, collection_date, SUM(amount) FROM staging_collections GROUP BY 1, 2"
+    ).fetchall():
+        when = time.mktime(datetime.date.fromisoformat(day).timetuple())
+        rollups.bump(conn, rollups.COLLECTIONS, collector, when, amount)
+    return {
+        'duplicates': duplicates,
+        'bills_updated': bills_updated,
+        'overpaid': pd.DataFrame([tuple(r) for r in overpaid], columns=['bill_no', 'amount_due', 'paid_amount']),
+    }
+
+
+def _to_record(row: sqlite3.Row) -> Dict:
+    record = dict(row)
+    record.pop('urgency', None)
+    record['complaint_no'] = format_complaint_no(record.pop('id'))
+    return record
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    # FULL keeps each acknowledged group commit durable across power loss
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+
+class ComplaintStore:
+    """SQLite complaint table with a group-committing writer thread."""
+
+    def __init__(self, path: str, max_batch: int = 1000, linger: float = 0.002):
+        self.path = path
+        self.max_batch = max_batch
+        self.linger = linger
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = connect(path)
+        self._writer.executescript(SCHEMA)
+        columns = [row['name'] for row in self._writer.execute("PRAGMA table_xinfo(complaints)")]
+        if 'urgency' not in columns:
+            self._writer.execute(
+                f"ALTER TABLE complaints ADD COLUMN urgency INTEGER GENERATED ALWAYS AS {URGENCY} VIRTUAL"
+            )
+        self._writer.execute(QUEUE_INDEX)
+        self._local = threading.local()
+        self._queue: "queue.Queue[Tuple[Callable[[sqlite3.Connection], Any], Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, name="complaint-writer", daemon=True)
+        self._thread.start()
+
+    # -------------------- Writes --------------------
+
+    def _enqueue(self, apply: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Hand a unit of work to the writer; its return value resolves the Future after commit."""
+        future: Future = Future()
+        self._queue.put((apply, future))
+        return future
+
+    def submit(self, complaint_type: str, description: str, priority: str,
+               consumer_no: str = '') -> "Future[str]":
+        """Queue a complaint; the Future resolves to its complaint number once committed."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        row = ((consumer_no or '').strip(), complaint_type, description, priority, time.time())
+
+        def apply(conn):
+            complaint_id = conn.execute(_INSERT, row).lastrowid
+            rollups.bump(conn, rollups.COMPLAINTS, complaint_type, row[-1])
+            rollups.bump(conn, rollups.UNRESOLVED, complaint_type, row[-1])
+            return format_complaint_no(complaint_id)
+
+        return self._enqueue(apply)
+
+    def register(self, complaint_type: str, description: str, priority: str,
+                 consumer_no: str = '', timeout: float = 30) -> str:
+        """Submit a complaint and wait until it is durable."""
+        return self.submit(complaint_type, description, priority, consumer_no).result(timeout)
+
+    def resolve(self, complaint_no: str, timeout: float = 30) -> bool:
+        """Close an open complaint. False if it does not exist or is already resolved."""
+        complaint_id = parse_complaint_no(complaint_no)
+        if complaint_id is None:
+            return False
+        now = time.time()
+
+        def apply(conn):
+            row = conn.execute(
+                "SELECT complaint_type, created_at FROM complaints WHERE id = ? AND status = 'Open'",
+                (complaint_id,),
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute("UPDATE complaints SET status = 'Resolved', resolved_at = ? WHERE id = ?", (now, complaint_id))
+            rollups.bump(conn, rollups.UNRESOLVED, row['complaint_type'], row['created_at'], -1)
+            rollups.bump(conn, rollups.RESOLVED, row['complaint_type'], now)
+            return True
+
+        return self._enqueue(apply).result(timeout)
+
+    def reprioritize(self, complaint_no: str, priority: str, timeout: float = 30) -> bool:
+        """Move an open complaint to another priority level."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        complaint_id = parse_complaint_no(complaint_no)
+        if complaint_id is None:
+            return False
+        return self._enqueue(lambda conn: conn.execute(
+            "UPDATE complaints SET priority = ? WHERE id = ? AND status = 'Open'",
+            (priority, complaint_id),
+        ).rowcount > 0).result(timeout)
+
+    def record_collection(self, collection_id: str, amount: float, collection_date: datetime.date,
+                          collector_name: str = '', consumer_no: str = '', bill_no: str = '',
+                          amount_due: float = 0.0, due_date: str = '', timeout: float = 30) -> Dict:
+        """Save one collection entered on the Collection Details tab.
+
+        Goes through the same staged apply as a bulk upload, so the bill's paid
+        amount and Payment Status are recomputed too (when a bill is given).
+        """
+        values = [(
+            collection_id.strip(), (consumer_no or '').strip(), (bill_no or '').strip(), float(amount),
+            collection_date.isoformat(), collector_name.strip(), float(amount_due), due_date or '',
+        )]
+
+        def apply(conn):
+            result = _apply_collections(conn, values, time.time())
+            if result['duplicates']:
+                raise ValueError(f"Collection {collection_id.strip()} is already recorded")
+            return result
+
+        return self._enqueue(apply).result(timeout)
+
+    def ingest_collections(self, rows: pd.DataFrame, timeout: float = 300) -> Dict:
+        """Apply a reconciled batch of collections in one set-based transaction.
+
+        rows carries collection_id, consumer_no, bill_no, amount, collection_date,
+        collector_name plus the bill's amount_due and due_date. Collection ids
+        already on file are skipped and reported; every touched bill gets its paid
+        amount and Payment Status (Paid / Pending / Overdue) recomputed.
+        """
+        values = list(zip(*(rows[c].tolist() for c in _COLLECTION_COLUMNS)))
+        now = time.time()
+        return self._enqueue(lambda conn: _apply_collections(conn, values, now)).result(timeout)
+
+    def record_document(self, name: str, digest: str, size: int, consumer_no: str = '', timeout: float = 30):
+        """Attach a stored document (see document_store.py) to a consumer."""
+        return self._enqueue(lambda conn: conn.execute(
+            "INSERT INTO documents (consumer_no, name, digest, size, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+            ((consumer_no or '').strip(), name, digest, size, time.time()),
+        ).lastrowid).result(timeout)
+
+    # Outage log for outage_engine.OutageEngine; all writes are fire and forget
+
+    def start_outage(self, source: str, element: str, area: str, started_at: float):
+        """Remember an outage in progress so a restart keeps its start time."""
+        return self._enqueue(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO active_outages (source, element, area, started_at) VALUES (?, ?, ?, ?)",
+            (source, element, area, started_at),
+        ))
+
+    def record_outage(self, source: str, element: str, area: str, started_at: float, restored_at: float):
+        """Log a finished outage and drop it from the outages in progress."""
+        def apply(conn):
+            conn.execute(
+                "INSERT INTO outage_events (source, element, area, started_at, restored_at) VALUES (?, ?, ?, ?, ?)",
+                (source, element, area, started_at, restored_at),
+            )
+            conn.execute("DELETE FROM active_outages WHERE source = ? AND element = ?", (source, element))
+
+        return self._enqueue(apply)
+
+    def start_area_outage(self, area: str, since: float):
+        """Remember when an area started having affected consumers."""
+        return self._enqueue(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO affected_areas (area, since) VALUES (?, ?)", (area, since),
+        ))
+
+    def end_area_outage(self, area: str, since: float, until: float):
+        """Add the area's affected span to its outage minutes, split over the days it covers."""
+        def apply(conn):
+            conn.execute("DELETE FROM affected_areas WHERE area = ?", (area,))
+            rollups.bump_minutes(conn, rollups.OUTAGE_MINUTES, area, since, until)
+
+        return self._enqueue(apply)
+
+    def active_outages(self) -> Tuple[List[Tuple[str, str, float]], Dict[str, float]]:
+        """Outages in progress as (source, element, started_at), and the affected areas' start times."""
+        conn = self._reader()
+        outages = [tuple(r) for r in conn.execute("SELECT source, element, started_at FROM active_outages")]
+        areas = {r['area']: r['since'] for r in conn.execute("SELECT area, since FROM affected_areas")}
+        return outages, areas
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Give concurrent sessions a moment to join this commit
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch: List[Tuple[Callable[[sqlite3.Connection], Any], Future]]):
+        results = []
+        try:
+            self._writer.execute("BEGIN IMMEDIATE")
+            for apply, _ in batch:
+                # A savepoint per unit keeps one bad write from failing the whole group
+                self._writer.execute("SAVEPOINT unit")
+                try:
+                    results.append((apply(self._writer), None))
+                    self._writer.execute("RELEASE unit")
+                except Exception as e:
+                    self._writer.execute("ROLLBACK TO unit")
+                    self._writer.execute("RELEASE unit")
+                    results.append((None, e))
+            self._writer.execute("COMMIT")
+        except Exception as e:
+            if self._writer.in_transaction:
+                self._writer.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), (value, error) in zip(batch, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    # -------------------- Reads --------------------
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def get(self, complaint_no: str) -> Optional[Dict]:
+        complaint_id = parse_complaint_no(complaint_no)
+        if complaint_id is None:
+            return None
+        row = self._reader().execute("SELECT * FROM complaints WHERE id = ?", (complaint_id,)).fetchone()
+        return _to_record(row) if row is not None else None
+
+    def for_consumer(self, consumer_no: str, limit: int = 50) -> List[Dict]:
+        rows = self._reader().execute(
+            "SELECT * FROM complaints WHERE consumer_no = ? ORDER BY id DESC LIMIT ?",
+            ((consumer_no or '').strip(), limit),
+        ).fetchall()
+        return [_to_record(row) for row in rows]
+
+    def open_complaints(self) -> List[Dict]:
+        """Complaint number and consumer of every open complaint raised for a consumer."""
+        rows = self._reader().execute(
+            "SELECT id, consumer_no FROM complaints WHERE status = 'Open' AND consumer_no != ''"
+        ).fetchall()
+        return [{'complaint_no': format_complaint_no(row['id']), 'consumer_no': row['consumer_no']} for row in rows]
+
+    def pending_count(self) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM complaints WHERE status = 'Open'").fetchone()[0]
+
+    def pending_page(self, after: Optional[Tuple[int, float, int]] = None,
+                     limit: int = 25) -> Tuple[List[Dict], Optional[Tuple[int, float, int]]]:
+        """One page of the pending queue, most urgent and oldest first.
+
+        `after` is the cursor returned with the previous page; the returned
+        cursor is None on the last page.
+        """
+        after = after or (-1, 0.0, 0)
+        rows = self._reader().execute(
+            "SELECT * FROM complaints WHERE status = 'Open' AND (urgency, created_at, id) > (?, ?, ?) "
+            "ORDER BY urgency, created_at, id LIMIT ?",
+            (*after, limit + 1),
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = (rows[-1]['urgency'], rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+        return [_to_record(row) for row in rows], cursor
+
+    def documents_for(self, consumer_no: str, limit: int = 100) -> List[Dict]:
+        rows = self._reader().execute(
+            "SELECT * FROM documents WHERE consumer_no = ? ORDER BY id DESC LIMIT ?",
+            ((consumer_no or '').strip(), limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def bill_payments(self, bill_nos: List[str]) -> pd.DataFrame:
+        """Paid amount and current Payment Status for the given bills (only those with payments)."""
+        if not bill_nos:
+            return pd.DataFrame(columns=['bill_no', 'paid_amount', 'payment_status'])
+        rows = self._reader().execute(
+            f"SELECT bill_no, paid_amount, payment_status FROM bill_payments "
+            f"WHERE bill_no IN ({','.join('?' * len(bill_nos))})",
+            list(bill_nos),
+        ).fetchall()
+        return pd.DataFrame([tuple(r) for r in rows], columns=['bill_no', 'paid_amount', 'payment_status'])
+
+    # -------------------- Reports --------------------
+
+    def report_totals(self, metric: str, start: datetime.date, end: datetime.date):
+        return rollups.totals(self._reader(), metric, start, end)
+
+    def report_series(self, metric: str, grain: str, start: datetime.date, end: datetime.date):
+        return rollups.series(self._reader(), metric, grain, start, end)
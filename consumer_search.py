@@ -0,0 +1,283 @@
+"""
+Consumer search index for the Registration Form in main.py.
+
+Each searchable consumer column gets its own read-only lookup structures, one
+per "Search Condition":
+- Equals      -> hash map of value -> slot in the sorted key array
+- Starts With -> sorted keys, matching range found by binary search
+- Ends With   -> sorted reversed keys, same range search
+- Contains    -> trigram postings, intersected and then verified
+- Fuzzy       -> trigram postings rank candidates by shared grams, then a
+                 vectorized edit distance orders the best few thousand.
+                 Only consumer names are matched fuzzily; the other fields
+                 of a Fuzzy search use Contains and narrow the candidates
+                 before the names are ranked.
+
+Indexes are built once from a consumer DataFrame and never mutated, so a single
+instance can be shared by every Streamlit session via st.cache_resource.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Column name -> label used on the Registration Form
+SEARCH_FIELDS = {
+    'consumer_no': 'Consumer No',
+    'account_no': 'Account No',
+    'phone': 'Phone Number',
+    'consumer_name': 'Consumer Name',
+    'house_no': 'House Number',
+    'pole_no': 'Pole Number',
+    'meter_no': 'Meter Number',
+}
+
+SEARCH_CONDITIONS = ["Equals", "Contains", "Starts With", "Ends With", "Fuzzy"]
+# Fuzzy applies to names only; other fields fall back to Contains under that condition
+FUZZY_FIELDS = ('consumer_name',)
+
+NGRAM = 3
+FUZZY_CANDIDATES = 2000
+FUZZY_LIMIT = 50
+# Edit budget per query character: 1 edit up to 4 characters, 2 from 5 ("sahoo" -> "sahu"), 4 at 10
+FUZZY_EDIT_RATIO = 0.4
+_MAX_CHAR = '\U0010ffff'
+_NO_ROWS = np.empty(0, dtype=np.int64)
+
+
+def normalize(values: pd.Series) -> pd.Series:
+    """Normalize a column (or query) the same way for indexing and lookup."""
+    return values.fillna('').astype(str).str.strip().str.lower()
+
+
+def normalize_query(query: str) -> str:
+    return (query or '').strip().lower()
+
+
+def _sorted_counts(values: np.ndarray):
+    """Unique values and their counts, via a sort (faster than np.unique's hashing for ids)."""
+    values = np.sort(values)
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    return values[starts], np.diff(np.r_[starts, len(values)])
+
+
+def substring_edit_distance(query: str, keys: np.ndarray) -> np.ndarray:
+    """Edit distance from query to the closest substring of each key, vectorized over keys.
+
+    Matching against substrings lets "sahu" find "susant sahoo" at distance 1.
+    Each DP row is computed for all keys at once; the left-to-right insertion
+    chain within a row is resolved with a cumulative minimum.
+    """
+    if not len(keys):
+        return np.empty(0, dtype=np.int64)
+    width = max(int(np.char.str_len(keys).max()), 1)
+    codes = keys.astype(f'U{width}').view(np.uint32).reshape(len(keys), width)
+    lengths = np.char.str_len(keys)
+    offsets = np.arange(width + 1)
+
+    row = np.zeros((len(keys), width + 1), dtype=np.int64)  # empty query matches anywhere
+    for i, ch in enumerate(query, start=1):
+        diag = row[:, :-1] + (codes != ord(ch))
+        best = np.empty_like(row)
+        best[:, 0] = i
+        best[:, 1:] = np.minimum(row[:, 1:] + 1, diag)
+        row = np.minimum.accumulate(best - offsets, axis=1) + offsets
+
+    row[offsets > lengths[:, None]] = len(query)
+    return row.min(axis=1)
+
+
+def _prefix_range(sorted_keys: np.ndarray, prefix: str) -> slice:
+    lo = np.searchsorted(sorted_keys, prefix, side='left')
+    hi = np.searchsorted(sorted_keys, prefix + _MAX_CHAR, side='left')
+    return slice(int(lo), int(hi))
+
+
+class FieldIndex:
+    """Lookup structures for a single consumer column."""
+
+    def __init__(self, values: pd.Series):
+        keys = normalize(values).to_numpy(dtype=str)
+        self.keys = keys
+
+        # Equals / Starts With: keys sorted once, hash map points into the sorted run
+        self._order = np.argsort(keys, kind='stable')
+        self._sorted = keys[self._order]
+        starts = np.flatnonzero(np.r_[True, self._sorted[1:] != self._sorted[:-1]]) if len(keys) else _NO_ROWS
+        self._starts = starts
+        self._counts = np.diff(np.r_[starts, len(keys)])
+        self._exact = dict(zip(self._sorted[starts].tolist(), range(len(starts))))
+
+        # Ends With: same trick over the reversed strings
+        reversed_keys = pd.Series(keys).str[::-1].to_numpy(dtype=str)
+        self._rev_order = np.argsort(reversed_keys, kind='stable')
+        self._rev_sorted = reversed_keys[self._rev_order]
+
+        # Contains: trigram -> sorted row ids; keys shorter than a trigram are kept aside
+        self._grams = self._build_ngrams(keys)
+        lengths = np.char.str_len(keys) if len(keys) else np.empty(0, dtype=np.int64)
+        self._short_rows = np.flatnonzero(lengths < NGRAM)
+
+    @staticmethod
+    def _build_ngrams(keys: np.ndarray) -> Dict[str, np.ndarray]:
+        n = len(keys)
+        if not n:
+            return {}
+        series = pd.Series(keys)
+        lengths = series.str.len().to_numpy()
+        grams, rows = [], []
+        for offset in range(int(lengths.max()) - NGRAM + 1):
+            idx = np.flatnonzero(lengths >= offset + NGRAM)
+            grams.append(series.iloc[idx].str.slice(offset, offset + NGRAM).to_numpy(dtype=object))
+            rows.append(idx)
+        if not grams:
+            return {}
+        # Encode (gram, row) as one integer so a single sort orders and dedups the postings
+        codes, vocab = pd.factorize(np.concatenate(grams))
+        pairs = np.sort(codes.astype(np.int64) * n + np.concatenate(rows))
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+        codes, rows = np.divmod(pairs, n)
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        return {
+            vocab[code]: postings
+            for code, postings in zip(codes[starts].tolist(), np.split(rows, bounds))
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    def equals(self, query: str) -> np.ndarray:
+        slot = self._exact.get(query)
+        if slot is None:
+            return _NO_ROWS
+        start = self._starts[slot]
+        return self._order[start:start + self._counts[slot]]
+
+    def starts_with(self, query: str) -> np.ndarray:
+        return self._order[_prefix_range(self._sorted, query)]
+
+    def ends_with(self, query: str) -> np.ndarray:
+        return self._rev_order[_prefix_range(self._rev_sorted, query[::-1])]
+
+    def contains(self, query: str) -> np.ndarray:
+        if len(query) >= NGRAM:
+            grams = {query[i:i + NGRAM] for i in range(len(query) - NGRAM + 1)}
+            postings = [self._grams.get(g) for g in grams]
+            if any(p is None for p in postings):
+                return _NO_ROWS
+            postings.sort(key=len)
+            candidates = postings[0]
+            for p in postings[1:]:
+                candidates = np.intersect1d(candidates, p, assume_unique=True)
+                if not len(candidates):
+                    return _NO_ROWS
+        else:
+            # Short query: union the postings of every trigram containing it
+            postings = [rows for gram, rows in self._grams.items() if query in gram]
+            postings.append(self._short_rows)
+            candidates = np.unique(np.concatenate(postings))
+        if not len(candidates):
+            return _NO_ROWS
+        hits = np.char.find(self.keys[candidates], query) >= 0
+        return candidates[hits]
+
+    def fuzzy(self, query: str, limit: Optional[int] = FUZZY_LIMIT, within: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows ranked by closeness to query, best first; only rows in `within` when given."""
+        if len(query) < NGRAM:
+            rows = self.contains(query)
+            return rows if within is None else rows[np.isin(rows, within)]
+        grams = {query[i:i + NGRAM] for i in range(len(query) - NGRAM + 1)}
+        postings = [self._grams[g] for g in grams if g in self._grams]
+        if not postings:
+            return _NO_ROWS
+
+        # Prefilter: keep the rows sharing the most trigrams with the query
+        candidates, shared = _sorted_counts(np.concatenate(postings))
+        if within is not None:
+            keep = np.isin(candidates, within)
+            candidates, shared = candidates[keep], shared[keep]
+        if len(candidates) > FUZZY_CANDIDATES:
+            top = np.argpartition(-shared, FUZZY_CANDIDATES)[:FUZZY_CANDIDATES]
+            candidates = candidates[top]
+
+        keys = self.keys[candidates]
+        distance = substring_edit_distance(query, keys)
+        max_distance = max(1, int(len(query) * FUZZY_EDIT_RATIO))
+        keep = distance <= max_distance
+        candidates, keys, distance = candidates[keep], keys[keep], distance[keep]
+        # Closer first; among equals, prefer keys whose length is nearest the query's
+        length_gap = np.abs(np.char.str_len(keys) - len(query))
+        ranked = np.lexsort((length_gap, distance))
+        return candidates[ranked[:limit]]
+
+    def lookup(self, query: str, condition: str) -> np.ndarray:
+        if condition == "Fuzzy":
+            return self.fuzzy(query)
+        if condition == "Equals":
+            return self.equals(query)
+        if condition == "Starts With":
+            return self.starts_with(query)
+        if condition == "Ends With":
+            return self.ends_with(query)
+        if condition == "Contains":
+            return self.contains(query)
+        raise ValueError(f"Unknown search condition: {condition}")
+
+
+def _field_condition(field: str, condition: str) -> str:
+    return "Contains" if condition == "Fuzzy" and field not in FUZZY_FIELDS else condition
+
+
+class ConsumerSearchIndex:
+    """Per-field indexes over a consumer table, combined with AND semantics."""
+
+    def __init__(self, consumers: pd.DataFrame, fields: Optional[List[str]] = None):
+        self.consumers = consumers.reset_index(drop=True)
+        fields = fields or list(SEARCH_FIELDS)
+        self.fields = {
+            col: FieldIndex(self.consumers[col])
+            for col in fields if col in self.consumers.columns
+        }
+
+    def __len__(self):
+        return len(self.consumers)
+
+    def lookup(self, field: str, query: str, condition: str) -> np.ndarray:
+        """Return positional row ids matching a single field."""
+        if field not in self.fields:
+            return _NO_ROWS
+        return self.fields[field].lookup(normalize_query(query), _field_condition(field, condition))
+
+    def search_rows(self, criteria: Dict[str, str], condition: str) -> np.ndarray:
+        """Row ids matching every non-empty criterion.
+
+        Rows come back in table order, except for Fuzzy with a name, where
+        the rows matching every other field are ranked by the name.
+        """
+        criteria = {f: normalize_query(q) for f, q in criteria.items() if normalize_query(q)}
+        if not criteria:
+            return _NO_ROWS
+        fuzzy = {f: q for f, q in criteria.items() if _field_condition(f, condition) == "Fuzzy"}
+        exact = [
+            np.sort(self.fields[f].lookup(q, _field_condition(f, condition))) if f in self.fields else _NO_ROWS
+            for f, q in criteria.items() if f not in fuzzy
+        ]
+        rows = None
+        for m in sorted(exact, key=len):
+            rows = m if rows is None else np.intersect1d(rows, m, assume_unique=True)
+            if not len(rows):
+                return _NO_ROWS
+        # Rank the names only among rows the other fields allow, then truncate
+        for f, q in fuzzy.items():
+            if f not in self.fields:
+                return _NO_ROWS
+            rows = self.fields[f].fuzzy(q, limit=None, within=rows)
+        return rows
+
+    def search(self, criteria: Dict[str, str], condition: str, limit: Optional[int] = None) -> pd.DataFrame:
+        rows = self.search_rows(criteria, condition)
+        if limit is not None:
+            rows = rows[:limit]
+        return self.consumers.iloc[rows]
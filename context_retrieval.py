@@ -0,0 +1,181 @@
+"""
+Retrieval over uploaded context documents for app02.py.
+
+Each document is split into overlapping word windows and indexed once, when
+it is uploaded, as a term-major sparse matrix of term frequencies (CSC-style
+indptr/rows/tf arrays). A user turn is scored against every chunk with BM25.
+Only the query's terms are touched, and IDF and average length are taken
+across all documents. Just the top-k chunks go into the prompt, so prompt
+size stays bounded however large the uploads get.
+
+Indexes keep chunk offsets, not chunk text. The text of the winning chunks
+is fetched at search time through a loader, so a document whose text has
+been spilled to disk (see document_registry.py) is only read back when one
+of its chunks is actually retrieved.
+"""
+
+import re
+from itertools import chain
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 30
+DEFAULT_TOP_K = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r'\S+')
+_TOKEN = re.compile(r'\w\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def chunk_spans(text: str, chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of overlapping windows of whole words."""
+    spans = [m.span() for m in _WORD.finditer(text)]
+    if not spans:
+        return []
+    step = max(1, chunk_words - overlap)
+    windows = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_words]
+        windows.append((window[0][0], window[-1][1]))
+        if start + chunk_words >= len(spans):
+            break
+    return windows
+
+
+def chunk_text(text: str, chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Overlapping windows of whole words, cut from the original text (whitespace kept)."""
+    return [text[start:end] for start, end in chunk_spans(text, chunk_words, overlap)]
+
+
+class Hit(NamedTuple):
+    document: str
+    chunk_no: int
+    text: str
+    score: float
+
+
+class DocumentIndex:
+    """Chunk offsets of one document with a term-major term-frequency matrix."""
+
+    def __init__(self, name: str, text: str, chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+        self.name = name
+        self.spans = chunk_spans(text, chunk_words, overlap)
+        tokens = [tokenize(text[start:end]) for start, end in self.spans]
+        n = len(self.spans)
+        self.chunk_len = np.array([len(t) for t in tokens], dtype=np.float32)
+        flat = list(chain.from_iterable(tokens))
+        if not flat:
+            self.vocab: Dict[str, int] = {}
+            self.indptr = np.zeros(1, dtype=np.int64)
+            self.rows = np.zeros(0, dtype=np.int32)
+            self.tf = np.zeros(0, dtype=np.float32)
+            return
+        codes, terms = pd.factorize(np.array(flat, dtype=object))
+        chunk_ids = np.repeat(np.arange(n, dtype=np.int64), self.chunk_len.astype(np.int64))
+
+        # One entry per (term, chunk) pair, term-major, with its count
+        keys = np.sort(codes.astype(np.int64) * n + chunk_ids)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        pairs = keys[starts]
+        self.tf = np.diff(np.r_[starts, len(keys)]).astype(np.float32)
+        self.rows = (pairs % n).astype(np.int32)
+        self.indptr = np.searchsorted(pairs // n, np.arange(len(terms) + 1))
+        self.vocab = {term: i for i, term in enumerate(terms)}
+
+    def __len__(self):
+        return len(self.spans)
+
+    def chunk(self, text: str, chunk_no: int) -> str:
+        start, end = self.spans[chunk_no]
+        return text[start:end]
+
+    @property
+    def total_tokens(self) -> float:
+        return float(self.chunk_len.sum())
+
+    def df(self, term: str) -> int:
+        col = self.vocab.get(term)
+        return 0 if col is None else int(self.indptr[col + 1] - self.indptr[col])
+
+    def scores(self, idf: Dict[str, float], avgdl: float) -> np.ndarray:
+        scores = np.zeros(len(self.spans), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.chunk_len / avgdl)
+        for term, weight in idf.items():
+            col = self.vocab.get(term)
+            if col is None:
+                continue
+            lo, hi = self.indptr[col], self.indptr[col + 1]
+            rows, tf = self.rows[lo:hi], self.tf[lo:hi]
+            scores[rows] += weight * tf * (BM25_K1 + 1) / (tf + norm[rows])
+        return scores
+
+
+class ContextIndex:
+    """All of a session's document indexes, searched together.
+
+    load_text(key) returns the full text a document was indexed from.
+    """
+
+    def __init__(self, load_text: Callable[[str], str]):
+        self.documents: Dict[str, DocumentIndex] = {}
+        self.load_text = load_text
+
+    def add(self, key: str, index: DocumentIndex):
+        self.documents[key] = index
+
+    def remove(self, key: str):
+        self.documents.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.documents
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def num_chunks(self) -> int:
+        return sum(len(d) for d in self.documents.values())
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> List[Hit]:
+        terms = set(tokenize(query))
+        total = self.num_chunks
+        if not terms or not total or k <= 0:
+            return []
+        avgdl = max(sum(d.total_tokens for d in self.documents.values()) / total, 1.0)
+        idf = {}
+        for term in terms:
+            df = sum(d.df(term) for d in self.documents.values())
+            if df:
+                idf[term] = float(np.log(1 + (total - df + 0.5) / (df + 0.5)))
+        if not idf:
+            return []
+
+        candidates = []
+        for key, document in self.documents.items():
+            scores = document.scores(idf, avgdl)
+            top = np.flatnonzero(scores > 0)
+            if len(top) > k:
+                top = top[np.argpartition(-scores[top], k - 1)[:k]]
+            candidates.extend((float(scores[i]), key, int(i)) for i in top)
+        best = sorted(candidates, reverse=True)[:k]
+
+        # Fetch text only for the winners, one load per document
+        texts = {key: self.load_text(key) for key in {key for _, key, _ in best}}
+        return [
+            Hit(self.documents[key].name, chunk_no, self.documents[key].chunk(texts[key], chunk_no), score)
+            for score, key, chunk_no in best
+        ]
+
+
+def format_context(hits: List[Hit]) -> str:
+    """Prompt section carrying the retrieved excerpts."""
+    parts = [f"[{hit.document}, part {hit.chunk_no + 1}]\n{hit.text}" for hit in hits]
+    return "Relevant excerpts from the user's documents:\n\n" + "\n\n".join(parts)
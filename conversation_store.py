@@ -0,0 +1,261 @@
+"""
+Durable chat history for app01.py, app02.py and app03.py.
+
+Conversations and their messages live in SQLite (WAL mode, so readers never
+wait on the writer). A session keeps only its conversation id. The page URL
+carries the conversation's token instead: a random, unguessable string
+issued when the conversation is created. A browser refresh resumes the
+conversation through it. The sequential id is never accepted from outside,
+so nobody can open or append to another user's chat by editing the URL.
+It reads the messages it needs when it needs them:
+- the transcript loads only its newest window: an index seek on
+  (conversation_id, id), newest first, LIMIT n
+- prompts and exports stream the full history for the duration of one call
+
+Each new message is a single-row insert. The conversation's message count
+is bumped in the same transaction, so counting a conversation is a
+primary-key read.
+
+Message text is also indexed for full-text search in an FTS5 table that
+points at the messages table (external content, so text is not stored
+twice). Triggers index each message as it is inserted, in the same
+transaction, so the index never needs a periodic rebuild. Results are
+ranked by BM25 and come with highlighted snippets. Terms can be prefixes
+("hedg*"), and the last term always matches as a prefix (search as you
+type) once it is MIN_PREFIX_CHARS long. Prefix indexes of 2 and 3
+characters keep this fast on millions of messages. The index also holds each
+message's conversation id, and a search matches on it alongside the text:
+only the postings of the conversations the caller names are read and ranked,
+so a session never sees (or pays for) hits from chats it does not hold the
+token of. If SQLite was built without FTS5, search is disabled.
+"""
+
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utility_store import DATA_DIR
+
+DB_PATH = os.environ.get("CONVERSATION_DB_PATH", os.path.join(DATA_DIR, "conversations.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    app TEXT NOT NULL,
+    token TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, id);
+"""
+
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, conversation_id, content='messages', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content, conversation_id) VALUES (new.id, new.content, new.conversation_id);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content, conversation_id)
+    VALUES ('delete', old.id, old.content, old.conversation_id);
+END;
+"""
+
+# Rank on the text only; the conversation id column is there to filter on
+SEARCH_RANK = "INSERT INTO messages_fts(messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"
+
+# Indexes from before the conversation id column; dropped and rebuilt
+OLD_SEARCH_SCHEMA = """
+DROP TRIGGER IF EXISTS messages_fts_insert;
+DROP TRIGGER IF EXISTS messages_fts_delete;
+DROP TABLE IF EXISTS messages_fts;
+"""
+
+TOKEN_BYTES = 16
+
+# Shorter terms match whole words only: a 1-character prefix would scan the whole term list
+MIN_PREFIX_CHARS = 2
+
+# Snippet highlight markers: control characters that never occur in chat text
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_TERM = re.compile(r'(\w+)(\*?)')
+
+
+def match_query(text: str) -> str:
+    """FTS5 MATCH expression for free text: every term quoted, "term*" and the last term as prefixes."""
+    terms = _TERM.findall(text)
+    parts = []
+    for i, (term, star) in enumerate(terms):
+        prefix = (star or i == len(terms) - 1) and len(term) >= MIN_PREFIX_CHARS
+        parts.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+def _to_message(row: sqlite3.Row) -> Dict[str, Any]:
+    message = {'id': row['id'], 'role': row['role'], 'content': row['content'], 'created_at': row['created_at']}
+    if row['meta']:
+        message.update(json.loads(row['meta']))
+    return message
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    # NORMAL: a power cut may lose the last few messages, never corrupt the file
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ConversationStore:
+    """Process-wide: one writer connection behind a lock, one reader connection per thread."""
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._writer = connect(path)
+        self._writer.executescript(SCHEMA)
+        self._add_tokens()
+        self.searchable = self._create_search_index()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _add_tokens(self):
+        """Give conversations stored before tokens existed one each, then index them."""
+        columns = {row['name'] for row in self._writer.execute("PRAGMA table_info(conversations)")}
+        if 'token' not in columns:
+            self._writer.execute("ALTER TABLE conversations ADD COLUMN token TEXT")
+        missing = self._writer.execute("SELECT id FROM conversations WHERE token IS NULL").fetchall()
+        if missing:
+            self._writer.executemany(
+                "UPDATE conversations SET token = ? WHERE id = ?",
+                [(secrets.token_urlsafe(TOKEN_BYTES), row['id']) for row in missing],
+            )
+        self._writer.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_conversations_token ON conversations(token)")
+
+    def _create_search_index(self) -> bool:
+        existed = self._writer.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone() is not None
+        if existed:
+            columns = {row['name'] for row in self._writer.execute("PRAGMA table_info(messages_fts)")}
+            if 'conversation_id' not in columns:
+                self._writer.executescript(OLD_SEARCH_SCHEMA)
+                existed = False
+        try:
+            self._writer.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            return False  # no FTS5 in this SQLite build
+        if not existed:
+            # One-time backfill of messages stored before the index (or its current layout) existed
+            self._writer.execute(SEARCH_RANK)
+            self._writer.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        return True
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    # -------------------- Writes --------------------
+
+    def create(self, app: str) -> Tuple[int, str]:
+        """New conversation: its internal id and the token that addresses it from outside."""
+        now = time.time()
+        token = secrets.token_urlsafe(TOKEN_BYTES)
+        with self._write_lock:
+            cursor = self._writer.execute(
+                "INSERT INTO conversations (app, token, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (app, token, now, now),
+            )
+            return cursor.lastrowid, token
+
+    def append(self, conversation_id: int, role: str, content: str, **meta: Any) -> Dict[str, Any]:
+        """Store one message; extra fields (timings, attachments, ...) are kept as JSON."""
+        now = time.time()
+        meta_json = json.dumps(meta) if meta else None
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._writer.execute(
+                    "INSERT INTO messages (conversation_id, role, content, created_at, meta) VALUES (?, ?, ?, ?, ?)",
+                    (conversation_id, role, content, now, meta_json),
+                )
+                self._writer.execute(
+                    "UPDATE conversations SET message_count = message_count + 1, updated_at = ? WHERE id = ?",
+                    (now, conversation_id),
+                )
+                self._writer.execute("COMMIT")
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+        return {'id': cursor.lastrowid, 'role': role, 'content': content, 'created_at': now, **meta}
+
+    # -------------------- Reads --------------------
+
+    def resolve(self, token: str, app: str) -> Optional[int]:
+        """Id of the app's conversation with this token, or None."""
+        row = self._reader().execute(
+            "SELECT id FROM conversations WHERE token = ? AND app = ?", (token, app)
+        ).fetchone()
+        return row['id'] if row is not None else None
+
+    def count(self, conversation_id: int) -> int:
+        row = self._reader().execute(
+            "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        return row['message_count'] if row is not None else 0
+
+    def recent(self, conversation_id: int, limit: int) -> List[Dict[str, Any]]:
+        """The newest `limit` messages, oldest first."""
+        rows = self._reader().execute(
+            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT ?",
+            (conversation_id, limit),
+        ).fetchall()
+        return [_to_message(row) for row in reversed(rows)]
+
+    def messages(self, conversation_id: int) -> Iterator[Dict[str, Any]]:
+        """Every message, oldest first, read as it is consumed."""
+        cursor = self._reader().execute(
+            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY id", (conversation_id,)
+        )
+        for row in cursor:
+            yield _to_message(row)
+
+    def search(self, text: str, conversation_ids: Sequence[int],
+               limit: int = 20, snippet_tokens: int = 12) -> List[Dict[str, Any]]:
+        """Best matches within the given conversations first; snippet hits wrapped in HIGHLIGHT_START/END."""
+        query = match_query(text)
+        if not self.searchable or not query or not conversation_ids:
+            return []
+        sql = (
+            "SELECT m.id, m.conversation_id, c.token, m.role, m.created_at, "
+            "snippet(messages_fts, 0, ?, ?, '…', ?) AS snippet, rank AS score "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "JOIN conversations c ON c.id = m.conversation_id "
+        )
+        # The conversation filter is part of the MATCH, so other chats' postings are never ranked
+        owned = " OR ".join(f'"{int(i)}"' for i in conversation_ids)
+        params: List[Any] = [HIGHLIGHT_START, HIGHLIGHT_END, snippet_tokens]
+        placeholders = ", ".join("?" * len(conversation_ids))
+        sql += f"WHERE messages_fts MATCH ? AND m.conversation_id IN ({placeholders}) ORDER BY rank LIMIT ?"
+        params += [f"content : ({query}) AND conversation_id : ({owned})", *conversation_ids, limit]
+        return [dict(row) for row in self._reader().execute(sql, params).fetchall()]
@@ -0,0 +1,166 @@
+"""
+Per-session registry of context documents for app02.py.
+
+Documents are keyed by the SHA-256 of the uploaded bytes, so membership is
+a dict lookup and the same content uploaded twice (under any name) is kept
+once. The uploader's file id is mapped to that digest, so files already
+handled on an earlier rerun are not hashed again.
+
+Text kept in session state is capped per session. When the cap is passed,
+the largest resident texts are spilled to files in the registry's own
+directory under CONTEXT_SPILL_DIR and dropped from memory. Spilled text is
+read back only when it is needed: a preview reads just its first
+characters, and retrieval loads a document only when one of its chunks wins.
+
+The directory goes away with the registry: on close() (Clear Chat), or when
+the session ends and the registry is garbage collected. Directories left by
+a process that died are removed by the next process to spill.
+"""
+
+import os
+import secrets
+import shutil
+import threading
+import weakref
+from typing import Any, Dict, Iterator, List, Optional
+
+from pdf_extract import content_digest
+
+SPILL_DIR = os.environ.get("CONTEXT_SPILL_DIR", os.path.join("data", "context"))
+MEMORY_CAP_CHARS = int(os.environ.get("CONTEXT_MEMORY_CAP", 8_000_000))
+
+_swept = threading.Event()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def sweep_orphans(spill_dir: str = SPILL_DIR):
+    """Remove spill directories whose process is gone (named "<pid>-<random>"), and files from the flat layout."""
+    if not os.path.isdir(spill_dir):
+        return
+    for entry in os.scandir(spill_dir):
+        if entry.is_dir():
+            pid = entry.name.split('-', 1)[0]
+            if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif entry.name.endswith(('.txt', '.tmp')):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class ContextDocument:
+    """One attached document; text is None once spilled to disk."""
+
+    def __init__(self, digest: str, name: str, text: str):
+        self.digest = digest
+        self.name = name
+        self.chars = len(text)
+        self.text: Optional[str] = text
+
+    @property
+    def resident(self) -> bool:
+        return self.text is not None
+
+
+class DocumentRegistry:
+    """Content-hash keyed documents with a bounded amount of text in memory."""
+
+    def __init__(self, memory_cap: int = MEMORY_CAP_CHARS, spill_dir: str = SPILL_DIR):
+        self.memory_cap = memory_cap
+        self.spill_dir = os.path.join(spill_dir, f"{os.getpid()}-{secrets.token_hex(8)}")
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+        self.documents: Dict[str, ContextDocument] = {}
+        self.resident_chars = 0
+        self._uploads: Dict[str, str] = {}  # uploader file_id -> digest
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.documents
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self) -> Iterator[ContextDocument]:
+        return iter(self.documents.values())
+
+    def digest_for(self, uploaded_file) -> str:
+        """Content digest of an upload, hashed once per uploader file."""
+        digest = self._uploads.get(uploaded_file.file_id)
+        if digest is None:
+            digest = self._uploads[uploaded_file.file_id] = content_digest(uploaded_file)
+        return digest
+
+    def close(self):
+        """Delete the spilled text now instead of at garbage collection."""
+        self._cleanup()
+
+    def add(self, digest: str, name: str, text: str) -> ContextDocument:
+        document = self.documents.get(digest)
+        if document is None:
+            document = self.documents[digest] = ContextDocument(digest, name, text)
+            self.resident_chars += document.chars
+            self._enforce_cap()
+        return document
+
+    # -------------------- Memory cap --------------------
+
+    def set_memory_cap(self, memory_cap: int):
+        self.memory_cap = memory_cap
+        self._enforce_cap()
+
+    def _enforce_cap(self):
+        if self.resident_chars <= self.memory_cap:
+            return
+        resident = sorted((d for d in self.documents.values() if d.resident), key=lambda d: d.chars, reverse=True)
+        for document in resident:
+            if self.resident_chars <= self.memory_cap:
+                break
+            self._spill(document)
+
+    def _spill_path(self, digest: str) -> str:
+        return os.path.join(self.spill_dir, digest + '.txt')
+
+    def _spill(self, document: ContextDocument):
+        if not _swept.is_set():
+            _swept.set()
+            sweep_orphans(os.path.dirname(self.spill_dir))
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(self._spill_path(document.digest), 'w', encoding='utf-8', newline='') as f:
+            f.write(document.text)
+        document.text = None
+        self.resident_chars -= document.chars
+
+    # -------------------- Lazy reads --------------------
+
+    def text(self, digest: str) -> str:
+        document = self.documents[digest]
+        if document.text is not None:
+            return document.text
+        with open(self._spill_path(digest), encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def preview(self, digest: str, chars: int) -> str:
+        document = self.documents[digest]
+        if document.text is not None:
+            return document.text[:chars]
+        with open(self._spill_path(digest), encoding='utf-8', newline='') as f:
+            return f.read(chars)
+
+    def export(self) -> List[Dict[str, Any]]:
+        return [{'name': d.name, 'digest': d.digest, 'text': self.text(d.digest)} for d in self]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'documents': len(self.documents),
+            'resident_chars': self.resident_chars,
+            'spilled': sum(1 for d in self.documents.values() if not d.resident),
+        }
@@ -0,0 +1,169 @@
+"""
+Content-addressed document storage for the View Documents tab in main.py.
+
+Uploads are copied to disk in fixed-size chunks while being hashed, so no
+second full copy of the file is built in memory. Each file is stored once
+under its SHA-256 digest: uploading the same scanned bill twice adds a
+metadata row but no new bytes.
+
+Thumbnails (images) and text previews (PDFs) are produced by a process pool
+in the background. The script run only submits the job and moves on; the
+preview shows up on a later rerun once the file exists. Running jobs are
+kept by (preview file, source mtime), so a rerun finds the job instead of
+submitting another; a job drops out as soon as it finishes. A failed job is
+remembered for PREVIEW_RETRY_SECONDS so reruns report it, then retried.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from utility_store import DATA_DIR
+
+DOCUMENTS_DIR = os.environ.get("DOCUMENTS_DIR", os.path.join(DATA_DIR, "documents"))
+CHUNK_BYTES = 1 << 20
+THUMBNAIL_SIZE = (320, 320)
+PREVIEW_CHARS = 2000
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+PREVIEW_RETRY_SECONDS = 300
+
+
+def make_preview(source: str, destination: str, kind: str) -> Optional[str]:
+    """Build a thumbnail or text preview. Runs in a worker process."""
+    if kind == 'pdf':
+        try:
+            import PyPDF2
+        except ImportError:
+            return None
+    elif kind != 'image':
+        return None
+    # Unique temp name per job, so two workers never write the same file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(destination), suffix='.tmp', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        if kind == 'image':
+            from PIL import Image
+            with Image.open(source) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                image.convert('RGB').save(tmp_path, format='PNG')
+        else:
+            reader = PyPDF2.PdfReader(source)
+            text = (reader.pages[0].extract_text() or '') if reader.pages else ''
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text[:PREVIEW_CHARS])
+        os.replace(tmp_path, destination)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return destination
+
+
+class DocumentStore:
+    """Deduplicated blob store plus a background preview pool."""
+
+    def __init__(self, root: str = DOCUMENTS_DIR, workers: int = 2):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.previews_dir = os.path.join(root, 'previews')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.previews_dir, exist_ok=True)
+        # spawn, not fork: forking a threaded Streamlit server is unsafe
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._jobs: Dict[Tuple[str, float], Future] = {}  # running only
+        self._failed: Dict[Tuple[str, float], Tuple[float, Future]] = {}  # key -> (failed at, job)
+        self._jobs_lock = threading.Lock()
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def save(self, uploaded_file) -> Tuple[str, int, bool]:
+        """Stream an upload to disk. Returns (digest, size, is_new)."""
+        sha = hashlib.sha256()
+        size = 0
+        uploaded_file.seek(0)
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: uploaded_file.read(CHUNK_BYTES), b''):
+                    sha.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = sha.hexdigest()
+            path = self.object_path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                return digest, size, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.request_preview(digest, uploaded_file.name)
+        return digest, size, True
+
+    @staticmethod
+    def preview_kind(name: str) -> Optional[str]:
+        name = name.lower()
+        if name.endswith(IMAGE_EXTENSIONS):
+            return 'image'
+        if name.endswith('.pdf'):
+            return 'pdf'
+        return None
+
+    def preview_path(self, digest: str, name: str) -> Optional[str]:
+        kind = self.preview_kind(name)
+        if kind is None:
+            return None
+        return os.path.join(self.previews_dir, digest + ('.png' if kind == 'image' else '.txt'))
+
+    def request_preview(self, digest: str, name: str) -> Optional[Future]:
+        """Queue preview generation in the background, once per file; returns immediately.
+
+        Returns the job (running, finished or failed), or None when there is no
+        preview to make or it already exists.
+        """
+        destination = self.preview_path(digest, name)
+        if destination is None or os.path.exists(destination):
+            return None
+        source = self.object_path(digest)
+        key = (destination, os.path.getmtime(source))
+        now = time.monotonic()
+        with self._jobs_lock:
+            for stale in [k for k, (failed_at, _) in self._failed.items() if now - failed_at > PREVIEW_RETRY_SECONDS]:
+                del self._failed[stale]
+            if key in self._failed:
+                return self._failed[key][1]
+            job = self._jobs.get(key)
+            if job is not None:
+                return job
+            job = self._jobs[key] = self._pool.submit(make_preview, source, destination, self.preview_kind(name))
+        # Outside the lock: an already finished job runs the callback right here
+        job.add_done_callback(lambda done: self._finish(key, done))
+        return job
+
+    def _finish(self, key: Tuple[str, float], job: Future):
+        with self._jobs_lock:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+            if self.preview_failed(job):
+                self._failed[key] = (time.monotonic(), job)
+
+    def preview(self, digest: str, name: str) -> Optional[str]:
+        """Path of the finished preview, or None if there is none (yet)."""
+        path = self.preview_path(digest, name)
+        return path if path is not None and os.path.exists(path) else None
+
+    @staticmethod
+    def preview_failed(job: Optional[Future]) -> bool:
+        """Whether a finished job produced no preview (error, or no PDF library)."""
+        return job is not None and job.done() and (job.exception() is not None or job.result() is None)
+
+    def read(self, digest: str) -> bytes:
+        with open(self.object_path(digest), 'rb') as f:
+            return f.read()
@@ -0,0 +1,165 @@
+"""
+Process-wide pooled HTTP client for the chat backends.
+
+app01.py used to call requests.post() directly, which opens (and for HTTPS,
+handshakes) a new connection every turn. PooledHTTPClient keeps one
+requests.Session per backend origin. Connections stay alive between turns
+and are shared by every Streamlit session in the process, since the client
+is held in st.cache_resource.
+
+There is one client per process, and sessions inside it are keyed by
+endpoint. Changing the pool size, retries or keep-alive reconfigures that
+client. Its sessions are closed and rebuilt on next use, so no pool is left
+behind, and the per-endpoint metrics carry on.
+
+Retries use urllib3's Retry with exponential backoff. Connection failures are
+retried for any method because nothing reached the server. Read errors and
+502/503/504 responses are retried only for idempotent methods, so a chat
+POST is never sent twice.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF = 0.3
+
+
+def origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _counting(connection_cls, on_connect: Callable[[], None]):
+    class CountingConnection(connection_cls):
+        def connect(self):
+            on_connect()
+            super().connect()
+    return CountingConnection
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that reports every new TCP connection, so reuse is visible in the metrics."""
+
+    def __init__(self, on_connect: Callable[[], None], **kwargs):
+        self.on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(pool_cls.__name__, (pool_cls,), {
+                'ConnectionCls': _counting(pool_cls.ConnectionCls, self.on_connect),
+            })
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class PooledHTTPClient:
+    """Keep-alive sessions keyed by endpoint origin, with per-endpoint metrics."""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF, keep_alive: bool = True):
+        self.backoff = backoff
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        self._apply(pool_size, max_retries, keep_alive)
+        self._metrics: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {'requests': 0, 'errors': 0, 'connections': 0, 'total_time': 0.0, 'max_time': 0.0}
+        )
+
+    def _apply(self, pool_size: int, max_retries: int, keep_alive: bool):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive
+        self.retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=self.backoff,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+
+    def configure(self, pool_size: int, max_retries: int, keep_alive: bool):
+        """Change pool and retry settings; the old sessions are closed, metrics are kept."""
+        with self._lock:
+            if (pool_size, max_retries, keep_alive) == (self.pool_size, self.max_retries, self.keep_alive):
+                return
+            self._apply(pool_size, max_retries, keep_alive)
+            old_sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in old_sessions:
+            # Idle connections close now; ones still in use close when their request returns
+            session.close()
+
+    def session_for(self, url: str) -> requests.Session:
+        key = origin(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = CountingAdapter(
+                    on_connect=lambda: self._count_connection(key),
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=self.retry,
+                )
+                session.mount(key, adapter)
+                if not self.keep_alive:
+                    session.headers['Connection'] = 'close'
+                self._sessions[key] = session
+            return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        session = self.session_for(url)
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = session.request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self._record(url, time.perf_counter() - start, failed)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def _record(self, url: str, elapsed: float, failed: bool):
+        with self._lock:
+            m = self._metrics[origin(url)]
+            m['requests'] += 1
+            m['errors'] += int(failed)
+            m['total_time'] += elapsed
+            m['max_time'] = max(m['max_time'], elapsed)
+
+    def _count_connection(self, key: str):
+        with self._lock:
+            self._metrics[key]['connections'] += 1
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint request counts, errors, latency and connections actually opened."""
+        with self._lock:
+            snapshot = {}
+            for key, m in self._metrics.items():
+                snapshot[key] = {
+                    'requests': m['requests'],
+                    'errors': m['errors'],
+                    'avg_ms': round(1000 * m['total_time'] / m['requests'], 1) if m['requests'] else 0.0,
+                    'max_ms': round(1000 * m['max_time'], 1),
+                    'connections_opened': m['connections'],
+                }
+            return snapshot
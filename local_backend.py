@@ -0,0 +1,169 @@
+"""
+Local stand-in chat backend for testing app01.py offline.
+
+Speaks the protocol described in chat_backend.py:
+- legacy full-history payloads ("message" + "conversation_history")
+- delta sync ("conversation_id" + "base" + "messages"), answering 409 when the
+  conversation is unknown or the base count does not match
+- JSON replies, or Server-Sent Events when the request has "stream": true
+
+Conversations live in memory, least recently used first out, so a small
+--max-conversations (or POST /reset) exercises the client's full resync path.
+
+    python local_backend.py --port 8000 --token-delay 0.05
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+
+class ConversationTable:
+    """In-memory conversations with LRU eviction."""
+
+    def __init__(self, max_conversations: int = 100):
+        self.max_conversations = max_conversations
+        self._conversations: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, history: List[Dict]) -> str:
+        conversation_id = uuid.uuid4().hex
+        with self._lock:
+            self._conversations[conversation_id] = list(history)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        return conversation_id
+
+    def extend(self, conversation_id: str, base: int, messages: List[Dict]) -> Optional[List[Dict]]:
+        """Append a delta; None if the conversation is gone or base is out of step."""
+        with self._lock:
+            history = self._conversations.get(conversation_id)
+            if history is None or len(history) != base:
+                return None
+            self._conversations.move_to_end(conversation_id)
+            history.extend(messages)
+            return list(history)
+
+    def append(self, conversation_id: str, message: Dict):
+        with self._lock:
+            history = self._conversations.get(conversation_id)
+            if history is not None:
+                history.append(message)
+
+    def clear(self):
+        with self._lock:
+            self._conversations.clear()
+
+
+def generate_reply(history: List[Dict]) -> List[str]:
+    """Deterministic reply, split into word tokens."""
+    last = next((m["content"] for m in reversed(history) if m["role"] == "user"), "")
+    text = f"Echo ({len(history)} messages in context): {last}"
+    words = text.split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+def make_handler(table: ConversationTable, token_delay: float):
+    class ChatHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client hung up mid-reply, e.g. the losing side of a hedged request
+
+        def _send_json(self, status: int, body: Dict, conversation_id: Optional[str] = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if conversation_id:
+                self.send_header("X-Conversation-Id", conversation_id)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def _stream(self, tokens: List[str], conversation_id: Optional[str]):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            if conversation_id:
+                self.send_header("X-Conversation-Id", conversation_id)
+            self.end_headers()
+            for token in tokens:
+                if token_delay:
+                    time.sleep(token_delay)
+                self._write_chunk(f"data: {json.dumps({'token': token})}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+
+        def _resolve(self, body: Dict) -> Tuple[Optional[List[Dict]], Optional[str]]:
+            """Full history for this turn and the conversation it belongs to."""
+            if "messages" in body and body.get("conversation_id"):
+                history = table.extend(body["conversation_id"], int(body.get("base", 0)), body["messages"])
+                return history, body["conversation_id"]
+            history = list(body.get("conversation_history", []))
+            history.append({"role": "user", "content": body.get("message", "")})
+            if "conversation_id" in body:
+                return history, table.start(history)
+            return history, None  # legacy client, stateless
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": "invalid JSON"})
+                return
+            if self.path.rstrip("/").endswith("/reset"):
+                table.clear()
+                self._send_json(200, {"status": "reset"})
+                return
+
+            history, conversation_id = self._resolve(body)
+            if history is None:
+                self._send_json(409, {"error": "conversation_not_found"})
+                return
+            tokens = generate_reply(history)
+            if conversation_id:
+                table.append(conversation_id, {"role": "assistant", "content": "".join(tokens)})
+            if body.get("stream"):
+                self._stream(tokens, conversation_id)
+            else:
+                time.sleep(token_delay * len(tokens))
+                self._send_json(200, {"response": "".join(tokens), "conversation_id": conversation_id},
+                                conversation_id)
+
+    return ChatHandler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, max_conversations: int = 100,
+          token_delay: float = 0.0) -> ThreadingHTTPServer:
+    """Build the server; call serve_forever() on the result (or run it in a thread)."""
+    table = ConversationTable(max_conversations)
+    return ThreadingHTTPServer((host, port), make_handler(table, token_delay))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-conversations", type=int, default=100)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.max_conversations, args.token_delay)
+    print(f"Chat backend listening on http://{args.host}:{args.port}/chat")
+    server.serve_forever()
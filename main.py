@@ -1,10 +1,90 @@
 import streamlit as st
 import datetime
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+
+from consumer_search import ConsumerSearchIndex, SEARCH_FIELDS, SEARCH_CONDITIONS
+from utility_store import UtilityStore, DATA_DIR
+from complaint_store import ComplaintStore, PRIORITIES, DB_PATH as COMPLAINT_DB_PATH
+from outage_engine import OutageEngine, OUTAGE_SOURCES
+from pending_requests import render_pending_requests
+from collection_ingest import BillLedger, ingest
+from document_store import DocumentStore
+from map_index import PointClusterIndex, build_points, viewport, MAP_LAYERS, MAX_ZOOM
 
 
 # Page configuration
 st.set_page_config(page_title="Power Utility Management System", layout="wide")
 
+# Data sources
+SEARCH_RESULT_LIMIT = 500
+
+
+@st.cache_resource(show_spinner="Opening utility data store...")
+def get_store():
+    """Open the memory-mapped data store once per process; all sessions share it read-only."""
+    return UtilityStore(DATA_DIR)
+
+
+@st.cache_resource(show_spinner="Building consumer search index...")
+def get_consumer_index():
+    """Build the consumer search index once per process and share it across sessions."""
+    return ConsumerSearchIndex(get_store().frame("consumers", columns=list(SEARCH_FIELDS) + ["lat", "lon"]))
+
+
+@st.cache_resource(show_spinner="Indexing bills for reconciliation...")
+def get_bill_ledger():
+    """Bill amounts and due dates keyed by bill number, shared by every bulk upload."""
+    return BillLedger(get_store().frame("bills", columns=["bill_no", "consumer_no", "amount", "due_date"]))
+
+
+@st.cache_resource
+def get_document_store():
+    """Shared document store; its preview worker pool lives as long as the server."""
+    return DocumentStore()
+
+
+def record_value(record, field, default=""):
+    """Read a field from a store record, falling back when the record or value is missing."""
+    if record is None or field not in record or pd.isna(record[field]):
+        return default
+    return record[field]
+
+
+@st.cache_resource
+def get_complaint_store():
+    """One complaint store (and writer thread) per process, shared by every session."""
+    return ComplaintStore(COMPLAINT_DB_PATH)
+
+
+@st.cache_resource(show_spinner="Loading network hierarchy...")
+def get_outage_engine():
+    """Shared outage state: every operator sees (and updates) the same live counts."""
+    store = get_store()
+    return OutageEngine(
+        store.frame("consumers", columns=["pole_no"]),
+        store.frame("poles"),
+        log=get_complaint_store(),
+    )
+
+
+@st.cache_resource(ttl=60, show_spinner="Clustering map points...")
+def get_map_index():
+    """Cluster poles, meters and open complaints; rebuilt every minute to pick up new complaints."""
+    store = get_store()
+    consumers = store.frame("consumers", columns=["consumer_no", "meter_no", "lat", "lon"])
+    open_complaints = pd.DataFrame(get_complaint_store().open_complaints(), columns=["complaint_no", "consumer_no"])
+    return PointClusterIndex(build_points(consumers, store.frame("poles"), open_complaints))
+
+
+store = get_store()
+complaints = get_complaint_store()
+outages = get_outage_engine()
+
 # Custom CSS for styling
 st.markdown("""
     <style>
@@ -44,14 +124,15 @@ st.markdown("""
 st.title("New Request/Complaint Registration")
 
 # Tabs
-tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
     "Registration Form", 
     "Bill Details", 
     "Collection Details", 
     "Complaint Details", 
     "View Documents", 
     "View Latest Bill", 
-    "Power Outage Details"
+    "Power Outage Details",
+    "⏳ Pending Requests"
 ])
 
 with tab1:
@@ -65,6 +146,14 @@ with tab1:
         st.markdown("<br>", unsafe_allow_html=True)
         search_btn = st.button("🔍 Search", key="search_request")
     
+    if search_btn:
+        complaint = complaints.get(request_no)
+        if complaint is None:
+            st.warning(f"No request/complaint found for '{request_no}'")
+        else:
+            st.success(f"{complaint['complaint_no']} · {complaint['complaint_type']} · {complaint['status']}")
+            st.json(complaint)
+    
     st.markdown("---")
     
     # Search Section
@@ -82,45 +171,196 @@ with tab1:
         account_no = st.text_input("Account No", key="account")
         consumer_name = st.text_input("Consumer Name", key="name")
         pole_number = st.text_input("Pole Number", key="pole")
-        search_condition = st.selectbox("Search Condition", ["Equals", "Contains", "Starts With", "Ends With"])
+        search_condition = st.selectbox("Search Condition", SEARCH_CONDITIONS)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
     # Action Buttons
     col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
     with col1:
-        if st.button("🔍 Show", type="primary", use_container_width=True):
-            st.success("Searching records...")
+        show_btn = st.button("🔍 Show", type="primary", use_container_width=True)
     with col2:
         if st.button("🗺️ View Map", use_container_width=True):
-            st.info("Opening map view...")
+            st.session_state.show_map = not st.session_state.get("show_map", False)
+
+    if show_btn:
+        consumer_index = get_consumer_index()
+        criteria = {
+            "consumer_no": consumer_no,
+            "account_no": account_no,
+            "phone": phone_number,
+            "consumer_name": consumer_name,
+            "house_no": house_number,
+            "pole_no": pole_number,
+            "meter_no": meter_number,
+        }
+        if not any(v.strip() for v in criteria.values()):
+            st.warning("Enter at least one search field.")
+        elif len(consumer_index) == 0:
+            st.warning(f"No consumer data loaded. Import consumers into {DATA_DIR}/ with utility_store.py.")
+        else:
+            start = time.perf_counter()
+            rows = consumer_index.search_rows(criteria, search_condition)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            st.success(f"Found {len(rows):,} record(s) in {elapsed_ms:.1f} ms")
+            if len(rows) and {"lat", "lon"} <= set(consumer_index.consumers.columns):
+                # Center the map on the first match that has a usable location
+                matches = consumer_index.consumers.iloc[rows[:SEARCH_RESULT_LIMIT]]
+                lat = pd.to_numeric(matches["lat"], errors="coerce").to_numpy(dtype=float)
+                lon = pd.to_numeric(matches["lon"], errors="coerce").to_numpy(dtype=float)
+                located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+                if len(located):
+                    st.session_state.map_center = (float(lat[located[0]]), float(lon[located[0]]))
+            if len(rows):
+                st.dataframe(
+                    consumer_index.consumers.iloc[rows[:SEARCH_RESULT_LIMIT]],
+                    use_container_width=True,
+                    hide_index=True
+                )
+                if len(rows) > SEARCH_RESULT_LIMIT:
+                    st.caption(f"Showing first {SEARCH_RESULT_LIMIT} of {len(rows):,} matches. Refine the search to narrow results.")
+
+    if st.session_state.get("show_map"):
+        map_index = get_map_index()
+        if map_index.num_points == 0:
+            st.warning("No map data loaded. Add lat/lon columns to the consumers and poles tables.")
+        else:
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                map_zoom = st.slider("Zoom", 1, MAX_ZOOM + 2, 12, key="map_zoom")
+                map_layers = st.multiselect("Layers", MAP_LAYERS, default=MAP_LAYERS, key="map_layers")
+            center_lat, center_lon = st.session_state.get("map_center") or map_index.center
+            clusters = map_index.query(map_zoom, *viewport(center_lat, center_lon, map_zoom))
+            clusters = clusters[clusters["layer"].isin(map_layers)]
+            with col2:
+                st.caption(f"{len(clusters):,} clusters covering {int(clusters['count'].sum()):,} points in view. "
+                           "Clusters follow the zoom slider and the searched consumer; panning the map "
+                           "does not load new ones.")
+            colors = {"Pole": [0, 102, 204], "Meter": [92, 184, 92], "Complaint": [255, 136, 0]}
+            clusters = clusters.assign(
+                color=clusters["layer"].map(colors),
+                radius=20 * 2 ** (16 - map_zoom) * (1 + np.log2(clusters["count"].astype(float)))
+            )
+            st.pydeck_chart(pdk.Deck(
+                map_style=None,
+                initial_view_state=pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=map_zoom),
+                layers=[pdk.Layer(
+                    "ScatterplotLayer",
+                    data=clusters,
+                    get_position="[lon, lat]",
+                    get_fill_color="color",
+                    get_radius="radius",
+                    opacity=0.7,
+                    pickable=True
+                )],
+                tooltip={"text": "{layer}: {label}"}
+            ))
 
 with tab2:
     st.subheader("Bill Details")
-    st.info("Bill details will be displayed here")
+    bills = store.bills_for(consumer_no)
+    if not bills.empty:
+        # Payments applied since the store was built override the stored status
+        payments = complaints.bill_payments(bills["bill_no"].tolist()).set_index("bill_no")
+        bills["paid_amount"] = bills["bill_no"].map(payments["paid_amount"]).fillna(0.0)
+        bills["payment_status"] = bills["bill_no"].map(payments["payment_status"]).fillna(bills["payment_status"])
+    latest_bill = bills.iloc[-1].to_dict() if not bills.empty else None
+    if not consumer_no.strip():
+        st.info("Enter a Consumer No on the Registration Form to load bill details")
+    elif bills.empty:
+        st.info(f"No bills found for consumer {consumer_no}")
+    else:
+        st.dataframe(bills, use_container_width=True, hide_index=True)
     
-    # Sample bill details form
+    # Latest bill details form
+    payment_statuses = ["Paid", "Pending", "Overdue"]
+    latest_status = record_value(latest_bill, "payment_status", "Paid")
     col1, col2 = st.columns(2)
     with col1:
-        st.text_input("Bill Number")
-        st.text_input("Bill Amount")
-        st.date_input("Bill Date")
+        st.text_input("Bill Number", value=str(record_value(latest_bill, "bill_no")))
+        st.text_input("Bill Amount", value=str(record_value(latest_bill, "amount")))
+        st.date_input("Bill Date", value=record_value(latest_bill, "bill_date", "today"))
     with col2:
-        st.text_input("Due Date")
-        st.selectbox("Payment Status", ["Paid", "Pending", "Overdue"])
-        st.text_input("Payment Method")
+        st.text_input("Due Date", value=str(record_value(latest_bill, "due_date")))
+        st.selectbox(
+            "Payment Status",
+            payment_statuses,
+            index=payment_statuses.index(latest_status) if latest_status in payment_statuses else 0
+        )
+        st.text_input("Payment Method", value=str(record_value(latest_bill, "payment_method")))
 
 with tab3:
     st.subheader("Collection Details")
-    st.info("Collection details will be displayed here")
+    collections = store.collections_for(consumer_no)
+    if not consumer_no.strip():
+        st.info("Enter a Consumer No on the Registration Form to load collection details")
+    elif collections.empty:
+        st.info(f"No collections found for consumer {consumer_no}")
+    else:
+        st.metric("Total Collected", f"₹ {collections['amount'].sum():,.2f}")
+        st.dataframe(collections, use_container_width=True, hide_index=True)
     
     col1, col2 = st.columns(2)
     with col1:
-        st.text_input("Collection ID")
-        st.number_input("Amount Collected", min_value=0)
+        collection_id = st.text_input("Collection ID")
+        amount_collected = st.number_input("Amount Collected", min_value=0)
+        # Newest bill first; the collection is applied to it like a bulk-uploaded one
+        bill_options = bills["bill_no"].astype(str).tolist()[::-1] if not bills.empty else []
+        collection_bill = st.selectbox("Bill No", bill_options + ["(no bill)"])
     with col2:
-        st.date_input("Collection Date")
-        st.text_input("Collector Name")
+        collection_date = st.date_input("Collection Date")
+        collector_name = st.text_input("Collector Name")
+    
+    if st.button("💰 Record Collection", type="primary"):
+        if not collection_id.strip() or not amount_collected:
+            st.warning("Collection ID and a non-zero amount are required.")
+        else:
+            terms = get_bill_ledger().terms(collection_bill) if collection_bill in bill_options else None
+            try:
+                complaints.record_collection(
+                    collection_id, amount_collected, collection_date, collector_name, consumer_no,
+                    bill_no=collection_bill if terms else "",
+                    amount_due=terms[1] if terms else 0.0,
+                    due_date=terms[2] if terms else ""
+                )
+                st.success(f"Collection {collection_id} recorded")
+            except Exception as e:
+                st.error(f"⚠️ Could not save collection: {str(e)}")
+    
+    with st.expander("📤 Bulk Upload Collections"):
+        st.caption("CSV or Parquet with collection_id, bill_no, amount and optionally consumer_no, collection_date, collector_name")
+        bulk_file = st.file_uploader("Collection File", type=["csv", "parquet"], key="bulk_collections")
+        if bulk_file and st.button("Reconcile & Apply", type="primary"):
+            ledger = get_bill_ledger()
+            if len(ledger) == 0:
+                st.warning(f"No bills loaded. Import bills into {DATA_DIR}/ with utility_store.py.")
+            else:
+                progress = st.empty()
+                try:
+                    result = ingest(
+                        bulk_file, bulk_file.name, ledger, complaints,
+                        on_chunk=lambda n: progress.caption(f"Processed {n:,} rows...")
+                    )
+                except Exception as e:
+                    st.error(f"⚠️ Could not process file: {str(e)}")
+                else:
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("Rows Read", f"{result['rows']:,}")
+                    col2.metric("Applied", f"{result['applied']:,}")
+                    col3.metric("Amount Applied", f"₹ {result['amount']:,.2f}")
+                    col4.metric("Bills Updated", f"{result['bills_updated']:,}")
+                    mismatches = result["mismatches"]
+                    if len(mismatches):
+                        st.warning(f"{len(mismatches):,} mismatch(es)")
+                        st.dataframe(mismatches.head(SEARCH_RESULT_LIMIT), use_container_width=True, hide_index=True)
+                        st.download_button(
+                            "Download Mismatches",
+                            mismatches.to_csv(index=False),
+                            file_name=f"mismatches_{bulk_file.name}.csv",
+                            mime="text/csv"
+                        )
+                    else:
+                        st.success("All rows reconciled")
 
 with tab4:
     st.subheader("Complaint Details")
@@ -134,41 +374,124 @@ with tab4:
         "Other"
     ])
     complaint_desc = st.text_area("Complaint Description", height=150)
-    priority = st.select_slider("Priority", options=["Low", "Medium", "High", "Critical"])
+    priority = st.select_slider("Priority", options=PRIORITIES)
+    
+    if st.button("📨 Submit Complaint", type="primary"):
+        if not complaint_desc.strip():
+            st.warning("Please describe the complaint before submitting.")
+        else:
+            try:
+                complaint_no = complaints.register(complaint_type, complaint_desc, priority, consumer_no)
+                st.success(f"Complaint registered. Request/Complaint No.: {complaint_no}")
+            except Exception as e:
+                st.error(f"⚠️ Could not save complaint: {str(e)}")
 
 with tab5:
     st.subheader("View Documents")
-    st.info("Documents will be displayed here")
+    documents = get_document_store()
     
     uploaded_file = st.file_uploader("Upload Document", type=["pdf", "jpg", "png", "doc"])
     if uploaded_file:
-        st.success(f"File uploaded: {uploaded_file.name}")
+        # The uploader keeps the file across reruns; store each upload only once
+        saved_uploads = st.session_state.setdefault("saved_uploads", {})
+        if uploaded_file.file_id not in saved_uploads:
+            digest, size, is_new = documents.save(uploaded_file)
+            complaints.record_document(uploaded_file.name, digest, size, consumer_no)
+            saved_uploads[uploaded_file.file_id] = is_new
+        if saved_uploads[uploaded_file.file_id]:
+            st.success(f"File uploaded: {uploaded_file.name}")
+        else:
+            st.success(f"File uploaded: {uploaded_file.name} (identical file already stored, not duplicated)")
+    
+    consumer_documents = complaints.documents_for(consumer_no) if consumer_no.strip() else []
+    if not consumer_no.strip():
+        st.info("Enter a Consumer No on the Registration Form to view documents")
+    elif not consumer_documents:
+        st.info(f"No documents found for consumer {consumer_no}")
+    else:
+        labels = {
+            f"{d['name']} · {d['size'] / 1024:,.0f} KB · "
+            f"{datetime.datetime.fromtimestamp(d['uploaded_at']).strftime('%d %b %Y %H:%M')}": d
+            for d in consumer_documents
+        }
+        selected_doc = labels[st.selectbox("Document", list(labels))]
+        preview = documents.preview(selected_doc["digest"], selected_doc["name"])
+        if preview is None and documents.preview_path(selected_doc["digest"], selected_doc["name"]):
+            # Finds the job already submitted for this file rather than queueing another
+            job = documents.request_preview(selected_doc["digest"], selected_doc["name"])
+            if documents.preview_failed(job):
+                st.caption("No preview available for this document")
+            else:
+                st.caption("Preview is being generated...")
+        elif preview and preview.endswith(".png"):
+            st.image(preview)
+        elif preview:
+            with open(preview, encoding="utf-8") as f:
+                st.text(f.read())
+        # The file is read only when Download is clicked, not on every rerun
+        st.download_button(
+            "Download",
+            partial(documents.read, selected_doc["digest"]),
+            file_name=selected_doc["name"]
+        )
 
 with tab6:
     st.subheader("View Latest Bill")
-    st.info("Latest bill will be displayed here")
-    
-    # Sample bill display
-    st.markdown("""
-    **Bill Summary**
-    - Consumer Number: XXXX-XXXX-XXXX
-    - Billing Period: November 2025
-    - Amount Due: ₹ 2,500
-    - Due Date: 15th December 2025
-    """)
+    if latest_bill is None:
+        st.info("Latest bill will be displayed here once a consumer with bills is selected")
+    else:
+        st.markdown(f"""
+        **Bill Summary**
+        - Consumer Number: {latest_bill["consumer_no"]}
+        - Bill Number: {record_value(latest_bill, "bill_no", "-")}
+        - Billing Period: {record_value(latest_bill, "billing_period", "-")}
+        - Amount Due: ₹ {record_value(latest_bill, "amount", 0):,.2f}
+        - Due Date: {record_value(latest_bill, "due_date", "-")}
+        - Payment Status: {record_value(latest_bill, "payment_status", "-")}
+        """)
 
 with tab7:
     st.subheader("Power Outage Details")
-    st.info("Power outage information will be displayed here")
+    outage_mode = st.radio("Select Option", ["Individual", "Total Area"], horizontal=True, key="outage_mode")
     
-    col1, col2 = st.columns(2)
-    with col1:
-        st.text_input("Outage ID")
-        st.text_input("Affected Area")
-    with col2:
-        st.selectbox("Status", ["Reported", "Under Investigation", "Resolved"])
-        st.text_input("Estimated Restoration Time")
-        st.number_input("Affected Consumers", min_value=0)
+    if outage_mode == "Individual":
+        col1, col2 = st.columns(2)
+        with col1:
+            outage_source = st.selectbox("Outage Source", OUTAGE_SOURCES)
+            outage_element = st.text_input(f"{outage_source} Number", key="outage_element").strip()
+            outage_status = st.selectbox("Status", ["Reported", "Under Investigation", "Resolved"])
+            st.text_input("Estimated Restoration Time")
+        
+        known = outages.has_pole(outage_element) if outage_source == "Pole" else outages.has_feeder(outage_element)
+        if st.button("⚡ Update Outage", type="primary", disabled=not outage_element):
+            if not known:
+                st.warning(f"{outage_source} {outage_element} is not in the network hierarchy")
+            elif outages.set_outage(outage_source, outage_element, out=outage_status != "Resolved"):
+                st.success(f"{outage_source} {outage_element} marked {outage_status.lower()}")
+            else:
+                st.info(f"{outage_source} {outage_element} already {outage_status.lower()}")
+        
+        with col2:
+            if outage_source == "Pole":
+                affected_area = outages.area_of_pole(outage_element) if known else ""
+            else:
+                affected_area = outages.area_of_feeder(outage_element) if known else ""
+            st.text_input("Affected Area", value=affected_area, disabled=True)
+            st.number_input(
+                "Affected Consumers",
+                value=outages.affected(outage_source, outage_element) if known else 0,
+                disabled=True
+            )
+    else:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Affected Consumers", f"{outages.total_affected:,}")
+        col2.metric("Poles Out", len(outages.out_poles))
+        col3.metric("Feeders Out", len(outages.out_feeders))
+        st.dataframe(outages.area_summary(), use_container_width=True, hide_index=True)
+
+with tab8:
+    st.subheader("Pending Requests")
+    render_pending_requests(complaints)
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,152 @@
+"""
+Server-side point clustering for the "View Map" button in main.py.
+
+Poles, meters and open complaints are projected to Web Mercator once. For a
+given zoom level every point falls into a grid cell (TILE_CELLS x TILE_CELLS
+cells per 256 px map tile); points sharing a layer and a cell are aggregated
+into one cluster with a count and a mean position. Levels are built lazily on
+first use, and clusters are cached per (zoom, tile), so a viewport request only
+concatenates the handful of tiles it covers and the browser only ever receives
+clusters, never the raw points.
+
+Points without finite coordinates are dropped. The map widget does not report
+its viewport back to the server, so the clusters are the ones for the view
+chosen in the app (center and zoom slider); panning or zooming inside the map
+only moves over the clusters already sent.
+"""
+
+import functools
+import math
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+MAX_ZOOM = 16
+TILE_SIZE = 256
+TILE_CELLS = 4
+LEVEL_CACHE_SIZE = 8  # deep levels hold about one cluster per point, so keep only a few
+MAP_LAYERS = ["Pole", "Meter", "Complaint"]
+
+_CLUSTER_COLUMNS = ['layer', 'lat', 'lon', 'count', 'label']
+
+
+def lonlat_to_xy(lon, lat):
+    """Project to normalized Web Mercator, both axes in [0, 1)."""
+    lat = np.clip(lat, -85.0511, 85.0511)
+    x = (np.asarray(lon) + 180.0) / 360.0
+    y = (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / math.pi) / 2
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+def xy_to_lonlat(x, y):
+    lon = np.asarray(x) * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * np.asarray(y)))))
+    return lon, lat
+
+
+def viewport(center_lat: float, center_lon: float, zoom: int,
+             width: int = 1000, height: int = 600) -> Tuple[float, float, float, float]:
+    """Approximate (west, south, east, north) bounds of a map of the given pixel size."""
+    cx, cy = lonlat_to_xy(center_lon, center_lat)
+    world = TILE_SIZE * 2 ** zoom
+    half_w, half_h = width / 2 / world, height / 2 / world
+    west, north = xy_to_lonlat(max(cx - half_w, 0), max(cy - half_h, 0))
+    east, south = xy_to_lonlat(min(cx + half_w, 1 - 1e-12), min(cy + half_h, 1 - 1e-12))
+    return float(west), float(south), float(east), float(north)
+
+
+def build_points(consumers: pd.DataFrame, poles: pd.DataFrame, open_complaints: pd.DataFrame) -> pd.DataFrame:
+    """Stack the map layers into one (layer, lat, lon, label) frame.
+
+    Meters sit at the consumer's location; open complaints are placed at the
+    location of the consumer they were raised for.
+    """
+    frames = []
+    if {'lat', 'lon'} <= set(poles.columns):
+        frames.append(pd.DataFrame({'layer': 'Pole', 'lat': poles['lat'], 'lon': poles['lon'], 'label': poles['pole_no']}))
+    if {'lat', 'lon'} <= set(consumers.columns):
+        frames.append(pd.DataFrame({'layer': 'Meter', 'lat': consumers['lat'], 'lon': consumers['lon'],
+                                    'label': consumers['meter_no']}))
+        if len(open_complaints):
+            located = open_complaints.merge(consumers[['consumer_no', 'lat', 'lon']], on='consumer_no')
+            frames.append(pd.DataFrame({'layer': 'Complaint', 'lat': located['lat'], 'lon': located['lon'],
+                                        'label': located['complaint_no']}))
+    if not frames:
+        return pd.DataFrame(columns=['layer', 'lat', 'lon', 'label'])
+    points = pd.concat(frames, ignore_index=True)
+    points['lat'] = pd.to_numeric(points['lat'], errors='coerce')
+    points['lon'] = pd.to_numeric(points['lon'], errors='coerce')
+    located = np.isfinite(points['lat']) & np.isfinite(points['lon'])
+    return points[located].reset_index(drop=True)
+
+
+class PointClusterIndex:
+    """Grid clusters per zoom level, served per tile."""
+
+    def __init__(self, points: pd.DataFrame, tile_cache_size: int = 4096):
+        lat = pd.to_numeric(points['lat'], errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(points['lon'], errors='coerce').to_numpy(dtype=float)
+        located = np.isfinite(lat) & np.isfinite(lon)
+        if not located.all():
+            points, lat, lon = points[located], lat[located], lon[located]
+        self.num_points = len(points)
+        x, y = lonlat_to_xy(lon, lat)
+        self._points = pd.DataFrame({
+            'layer': points['layer'].to_numpy(),
+            'x': x,
+            'y': y,
+            'label': points['label'].astype(str).to_numpy(),
+        })
+        self.center = (float(lat.mean()), float(lon.mean())) if len(points) else (0.0, 0.0)
+        # Per-instance caches so a rebuilt index does not keep the old one alive
+        self._level = functools.lru_cache(maxsize=LEVEL_CACHE_SIZE)(self._build_level)
+        self.tile = functools.lru_cache(maxsize=tile_cache_size)(self._tile)
+
+    def _build_level(self, zoom: int) -> Tuple[np.ndarray, pd.DataFrame]:
+        """All clusters of one zoom level, sorted by tile, plus the sorted tile keys."""
+        cells = 2 ** zoom * TILE_CELLS
+        frame = self._points.assign(
+            cx=(self._points['x'] * cells).astype(np.int64),
+            cy=(self._points['y'] * cells).astype(np.int64),
+        )
+        clusters = frame.groupby(['layer', 'cx', 'cy'], sort=False).agg(
+            x=('x', 'mean'), y=('y', 'mean'), count=('x', 'size'), label=('label', 'first'),
+        ).reset_index()
+        tile_keys = (clusters['cx'] // TILE_CELLS) * 2 ** zoom + clusters['cy'] // TILE_CELLS
+        order = np.argsort(tile_keys.to_numpy(), kind='stable')
+        return tile_keys.to_numpy()[order], clusters.iloc[order].reset_index(drop=True)
+
+    def _tile(self, zoom: int, tx: int, ty: int) -> pd.DataFrame:
+        tile_keys, clusters = self._level(zoom)
+        key = tx * 2 ** zoom + ty
+        lo, hi = np.searchsorted(tile_keys, [key, key + 1])
+        tile = clusters.iloc[lo:hi]
+        lon, lat = xy_to_lonlat(tile['x'].to_numpy(), tile['y'].to_numpy())
+        labels = np.where(tile['count'] > 1, tile['count'].map('{:,} points'.format), tile['label'])
+        return pd.DataFrame({
+            'layer': tile['layer'].to_numpy(),
+            'lat': lat,
+            'lon': lon,
+            'count': tile['count'].to_numpy(),
+            'label': labels,
+        })
+
+    def query(self, zoom: int, west: float, south: float, east: float, north: float) -> pd.DataFrame:
+        """Clusters for every tile overlapping the viewport."""
+        # Past the deepest level, clusters are already close to single points
+        zoom = min(zoom, MAX_ZOOM)
+        if not all(math.isfinite(v) for v in (west, south, east, north)):
+            return pd.DataFrame(columns=_CLUSTER_COLUMNS)
+        n = 2 ** zoom
+        x0, y0 = lonlat_to_xy(west, north)
+        x1, y1 = lonlat_to_xy(east, south)
+        tiles = [
+            self.tile(zoom, tx, ty)
+            for tx in range(int(x0 * n), int(x1 * n) + 1)
+            for ty in range(int(y0 * n), int(y1 * n) + 1)
+        ]
+        tiles = [t for t in tiles if len(t)]
+        if not tiles:
+            return pd.DataFrame(columns=_CLUSTER_COLUMNS)
+        return pd.concat(tiles, ignore_index=True)
@@ -0,0 +1,215 @@
+"""
+Outage aggregation for the Power Outage Details tab in main.py.
+
+The consumer -> pole -> feeder -> area hierarchy and the consumer count under
+every node are computed once. After that, marking a pole or feeder out (or
+restoring it) adjusts a handful of running counters, so the "Total Area" view
+reads live affected-consumer counts without rescanning consumers.
+
+Counting rules:
+- A feeder that is out affects every consumer under it.
+- Otherwise it affects the consumers on its poles that are individually out.
+- Poles that are out under a feeder that is also out are not double counted.
+
+Outage minutes are counted per area, for as long as the area has at least one
+affected consumer: a feeder and its poles out together count once. Every
+start time (each element's and each area's) goes to the outage log as it
+happens, so a restarted server picks up the outages still in progress with
+their original start times instead of treating them as just begun.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Protocol, Set, Tuple
+
+import pandas as pd
+
+UNASSIGNED = "Unassigned"
+OUTAGE_SOURCES = ["Pole", "Feeder"]
+
+
+class OutageLog(Protocol):
+    """Where the engine records outages (ComplaintStore implements it)."""
+
+    def start_outage(self, source: str, element: str, area: str, started_at: float): ...
+
+    def record_outage(self, source: str, element: str, area: str, started_at: float, restored_at: float): ...
+
+    def start_area_outage(self, area: str, since: float): ...
+
+    def end_area_outage(self, area: str, since: float, until: float): ...
+
+    def active_outages(self) -> Tuple[Iterable[Tuple[str, str, float]], Dict[str, float]]: ...
+
+
+class OutageEngine:
+    """Precomputed network hierarchy with incrementally maintained outage counts."""
+
+    def __init__(self, consumers: pd.DataFrame, poles: pd.DataFrame, log: Optional[OutageLog] = None):
+        """Outages still open in the log are replayed, keeping their start times."""
+        pole_counts = consumers.groupby('pole_no').size() if len(consumers) else pd.Series(dtype='int64')
+        self.pole_consumers: Dict[str, int] = {str(p): int(n) for p, n in pole_counts.items() if p}
+        self.pole_feeder: Dict[str, str] = {}
+        self.feeder_area: Dict[str, str] = {}
+        for pole, feeder, area in poles[['pole_no', 'feeder_no', 'area']].itertuples(index=False):
+            self.pole_feeder[str(pole)] = str(feeder or UNASSIGNED)
+            self.feeder_area.setdefault(str(feeder or UNASSIGNED), str(area or UNASSIGNED))
+        self.feeder_area.setdefault(UNASSIGNED, UNASSIGNED)
+
+        self.feeder_consumers: Dict[str, int] = defaultdict(int)
+        self.area_consumers: Dict[str, int] = defaultdict(int)
+        for pole, count in self.pole_consumers.items():
+            feeder = self.feeder_of(pole)
+            self.feeder_consumers[feeder] += count
+            self.area_consumers[self.feeder_area[feeder]] += count
+
+        # Live state
+        self.out_poles: Set[str] = set()
+        self.out_feeders: Set[str] = set()
+        self._feeder_pole_out: Dict[str, int] = defaultdict(int)  # consumers on out poles, per feeder
+        self._area_affected: Dict[str, int] = defaultdict(int)
+        self.total_affected = 0
+        self.started_at: Dict[Tuple[str, str], float] = {}
+        self.area_since: Dict[str, float] = {}
+        self.log: Optional[OutageLog] = None
+        self._lock = threading.Lock()
+        if log is not None:
+            self._replay(log)
+
+    def _replay(self, log: OutageLog):
+        """Rebuild the live state from the log, then reconcile the logged area start times."""
+        outages, area_since = log.active_outages()
+        for source, element, started_at in sorted(outages, key=lambda o: o[2]):
+            self.set_outage(source, element, True, at=started_at)
+        for area, since in area_since.items():
+            if area in self.area_since:
+                self.area_since[area] = since
+            else:
+                log.end_area_outage(area, since, time.time())
+        for area, since in self.area_since.items():
+            if area not in area_since:
+                log.start_area_outage(area, since)
+        self.log = log
+
+    # -------------------- Hierarchy --------------------
+
+    def feeder_of(self, pole: str) -> str:
+        return self.pole_feeder.get(pole, UNASSIGNED)
+
+    def area_of_feeder(self, feeder: str) -> str:
+        return self.feeder_area.get(feeder, UNASSIGNED)
+
+    def area_of_pole(self, pole: str) -> str:
+        return self.area_of_feeder(self.feeder_of(pole))
+
+    def has_pole(self, pole: str) -> bool:
+        return pole in self.pole_consumers or pole in self.pole_feeder
+
+    def has_feeder(self, feeder: str) -> bool:
+        return feeder in self.feeder_area
+
+    @property
+    def total_consumers(self) -> int:
+        return sum(self.pole_consumers.values())
+
+    # -------------------- Updates --------------------
+
+    def _shift_area(self, area: str, delta: int, now: float):
+        before = self._area_affected[area]
+        self._area_affected[area] += delta
+        self.total_affected += delta
+        after = self._area_affected[area]
+        if before <= 0 < after:
+            self.area_since[area] = now
+            if self.log is not None:
+                self.log.start_area_outage(area, now)
+        elif after <= 0 < before:
+            since = self.area_since.pop(area, now)
+            if self.log is not None:
+                self.log.end_area_outage(area, since, now)
+
+    def _track(self, source: str, element: str, area: str, out: bool, now: float):
+        if out:
+            self.started_at[(source, element)] = now
+            if self.log is not None:
+                self.log.start_outage(source, element, area, now)
+            return
+        started = self.started_at.pop((source, element), now)
+        if self.log is not None:
+            self.log.record_outage(source, element, area, started, now)
+
+    def set_pole(self, pole: str, out: bool, at: Optional[float] = None) -> bool:
+        """Mark a pole out or restored (now, or at the given time). Returns False if nothing changed."""
+        now = time.time() if at is None else at
+        with self._lock:
+            if out == (pole in self.out_poles):
+                return False
+            count = self.pole_consumers.get(pole, 0)
+            feeder = self.feeder_of(pole)
+            delta = count if out else -count
+            if out:
+                self.out_poles.add(pole)
+            else:
+                self.out_poles.discard(pole)
+            self._feeder_pole_out[feeder] += delta
+            if feeder not in self.out_feeders:
+                self._shift_area(self.area_of_feeder(feeder), delta, now)
+            self._track("Pole", pole, self.area_of_feeder(feeder), out, now)
+            return True
+
+    def set_feeder(self, feeder: str, out: bool, at: Optional[float] = None) -> bool:
+        """Mark a whole feeder out or restored (now, or at the given time). Returns False if nothing changed."""
+        now = time.time() if at is None else at
+        with self._lock:
+            if out == (feeder in self.out_feeders):
+                return False
+            # Consumers not already counted through individually failed poles
+            delta = self.feeder_consumers.get(feeder, 0) - self._feeder_pole_out[feeder]
+            if out:
+                self.out_feeders.add(feeder)
+            else:
+                self.out_feeders.discard(feeder)
+                delta = -delta
+            self._shift_area(self.area_of_feeder(feeder), delta, now)
+            self._track("Feeder", feeder, self.area_of_feeder(feeder), out, now)
+            return True
+
+    def set_outage(self, source: str, element: str, out: bool, at: Optional[float] = None) -> bool:
+        if source == "Pole":
+            return self.set_pole(element, out, at)
+        if source == "Feeder":
+            return self.set_feeder(element, out, at)
+        raise ValueError(f"Unknown outage source: {source}")
+
+    # -------------------- Reads --------------------
+
+    def affected_pole(self, pole: str) -> int:
+        if pole in self.out_poles or self.feeder_of(pole) in self.out_feeders:
+            return self.pole_consumers.get(pole, 0)
+        return 0
+
+    def affected_feeder(self, feeder: str) -> int:
+        if feeder in self.out_feeders:
+            return self.feeder_consumers.get(feeder, 0)
+        return self._feeder_pole_out[feeder]
+
+    def affected_area(self, area: str) -> int:
+        return self._area_affected[area]
+
+    def affected(self, source: str, element: str) -> int:
+        return self.affected_pole(element) if source == "Pole" else self.affected_feeder(element)
+
+    def area_summary(self) -> pd.DataFrame:
+        """One row per area with live affected counts; cost grows with areas, not consumers."""
+        rows = [
+            {
+                'area': area,
+                'consumers': total,
+                'affected_consumers': self._area_affected[area],
+                'affected_pct': round(100 * self._area_affected[area] / total, 1) if total else 0.0,
+            }
+            for area, total in self.area_consumers.items()
+        ]
+        summary = pd.DataFrame(rows, columns=['area', 'consumers', 'affected_consumers', 'affected_pct'])
+        return summary.sort_values('affected_consumers', ascending=False, ignore_index=True)
@@ -0,0 +1,243 @@
+"""
+Parallel, cached PDF text extraction for app02.py context uploads.
+
+The upload is hashed once (SHA-256 of its bytes). The extracted text is
+cached under that digest in memory (LRU, process-wide) and as a text file on
+disk (least recently used files removed past DISK_CACHE_BYTES). Re-uploading the same file, in this session or any other, is a cache
+hit that does no PDF parsing. Concurrent uploads of the same file share one
+extraction.
+
+On a miss, the PDF is written to a scratch file once. Page ranges are
+extracted by a spawn-based process pool, which keeps the script thread
+responsive. Progress (and the text of the pages finished so far, in order)
+is reported through a callback as ranges complete. Short PDFs are extracted
+inline, because starting worker processes would cost more than it saves.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+EXTRACT_CACHE_DIR = os.environ.get("EXTRACT_CACHE_DIR", os.path.join("data", "extracted"))
+PAGES_PER_TASK = 16
+MEMORY_CACHE_CHARS = 64 << 20
+DISK_CACHE_BYTES = int(os.environ.get("EXTRACT_CACHE_BYTES", 512 << 20))
+
+ProgressCallback = Callable[[int, int, str], None]  # (pages_done, total_pages, text_of_leading_pages)
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop). Runs in a worker process."""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+def content_digest(uploaded_file) -> str:
+    return hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+
+
+class _Extraction:
+    """One running extraction that any number of callers can wait on."""
+
+    def __init__(self):
+        self.total = 0
+        self.futures: Dict[Future, Tuple[int, int]] = {}
+        self.pages: List[Optional[str]] = []
+        self.error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def begin(self, total: int, futures: Dict[Future, Tuple[int, int]]):
+        self.total = total
+        self.futures = futures
+        self.pages = [None] * total
+        self._ready.set()
+
+    def fail(self, error: BaseException):
+        self.error = error
+        self._ready.set()
+
+    def wait(self, on_progress: Optional[ProgressCallback]) -> str:
+        self._ready.wait()
+        if self.error is not None:
+            raise self.error
+        done = 0
+        for future in as_completed(self.futures):
+            start, stop = self.futures[future]
+            texts = future.result()
+            with self._lock:
+                self.pages[start:stop] = texts
+                leading = []
+                for page in self.pages:
+                    if page is None:
+                        break
+                    leading.append(page)
+            done += stop - start
+            if on_progress is not None:
+                on_progress(done, self.total, '\n\n'.join(leading))
+        return '\n\n'.join(self.pages)
+
+
+class PdfExtractor:
+    """Process-wide: owns the worker pool, the text caches and the in-flight table."""
+
+    def __init__(self, cache_dir: str = EXTRACT_CACHE_DIR, workers: Optional[int] = None,
+                 memory_chars: int = MEMORY_CACHE_CHARS, disk_bytes: int = DISK_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.memory_chars = memory_chars
+        self.disk_bytes = disk_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._chars = 0
+        self._inflight: Dict[str, _Extraction] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: forking a threaded Streamlit server is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    # -------------------- Cache --------------------
+
+    def _disk_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest + '.txt')
+
+    def cached(self, digest: str) -> Optional[str]:
+        with self._lock:
+            text = self._memory.get(digest)
+            if text is not None:
+                self._memory.move_to_end(digest)
+                return text
+        path = self._disk_path(digest)
+        try:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            os.utime(path)  # mtime is the disk cache's recency
+        except FileNotFoundError:
+            return None
+        self._remember(digest, text)
+        return text
+
+    def _remember(self, digest: str, text: str):
+        with self._lock:
+            if digest in self._memory:
+                return
+            self._memory[digest] = text
+            self._chars += len(text)
+            while len(self._memory) > 1 and self._chars > self.memory_chars:
+                _, evicted = self._memory.popitem(last=False)
+                self._chars -= len(evicted)
+
+    def _store(self, digest: str, text: str):
+        self._remember(digest, text)
+        # Unique scratch name: other processes may be storing the same digest
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.cache_dir,
+                                         suffix='.tmp', delete=False) as f:
+            f.write(text)
+        os.replace(f.name, self._disk_path(digest))
+        self._trim_disk()
+
+    def _trim_disk(self):
+        """Remove the least recently used text files until the cache fits in disk_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.txt'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # -------------------- Extraction --------------------
+
+    def extract_text(self, uploaded_file, on_progress: Optional[ProgressCallback] = None,
+                     digest: Optional[str] = None) -> str:
+        digest = digest or content_digest(uploaded_file)
+        text = self.cached(digest)
+        if text is not None:
+            return text
+
+        with self._lock:
+            extraction = self._inflight.get(digest)
+            owner = extraction is None
+            if owner:
+                extraction = self._inflight[digest] = _Extraction()
+        scratch = None
+        try:
+            if owner:
+                try:
+                    scratch, total, futures = self._start(uploaded_file)
+                    extraction.begin(total, futures)
+                except BaseException as e:
+                    extraction.fail(e)
+                    raise
+            text = extraction.wait(on_progress)
+            if owner:
+                self._store(digest, text)
+            return text
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(digest, None)
+                if scratch is not None:
+                    self._remove_when_done(scratch, futures)
+
+    def _remove_when_done(self, path: str, futures: Dict[Future, Tuple[int, int]]):
+        """Delete the scratch PDF now, or once the last range still running (interrupted waiter) ends."""
+        pending = [future for future in futures if not future.done()]
+        if not pending:
+            os.remove(path)
+            return
+        remaining = [len(pending)]
+
+        def on_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                os.remove(path)
+
+        for future in pending:
+            future.add_done_callback(on_done)
+
+    def _start(self, uploaded_file) -> Tuple[str, int, Dict[Future, Tuple[int, int]]]:
+        """Write the scratch copy and queue its page ranges: (scratch_path, total_pages, futures)."""
+        import PyPDF2
+        fd, path = tempfile.mkstemp(dir=self.cache_dir, suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(uploaded_file.getbuffer())
+        try:
+            total = len(PyPDF2.PdfReader(path).pages)
+        except BaseException:
+            os.remove(path)
+            raise
+        ranges = [(start, min(start + PAGES_PER_TASK, total)) for start in range(0, total, PAGES_PER_TASK)]
+        if len(ranges) <= 1:
+            future = Future()
+            try:
+                future.set_result(extract_page_range(path, 0, total))
+            except Exception as e:
+                future.set_exception(e)
+            futures = {future: (0, total)} if total else {}
+        else:
+            futures = {self.pool.submit(extract_page_range, path, start, stop): (start, stop) for start, stop in ranges}
+        return path, total, futures
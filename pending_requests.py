@@ -0,0 +1,75 @@
+"""
+Pending Request view shared by main.py and tabs_app.py.
+
+Renders one keyset-paginated page of the open-complaint queue at a time. The
+session only keeps the stack of page cursors, never the queue itself.
+"""
+
+import datetime
+
+import pandas as pd
+import streamlit as st
+
+from complaint_store import ComplaintStore, PRIORITIES
+
+PAGE_SIZE = 25
+
+
+def render_pending_requests(complaints: ComplaintStore, key: str = "pending"):
+    cursors_key = f"{key}_cursors"
+    if cursors_key not in st.session_state:
+        st.session_state[cursors_key] = [None]  # cursor that starts each visited page
+    cursors = st.session_state[cursors_key]
+
+    total = complaints.pending_count()
+    if total == 0:
+        st.success("No pending requests.")
+        return
+    page, next_cursor = complaints.pending_page(cursors[-1], PAGE_SIZE)
+    if not page and len(cursors) > 1:
+        # Everything after this cursor was resolved elsewhere; step back a page
+        cursors.pop()
+        st.rerun()
+
+    st.warning(f"{total:,} pending request(s) · page {len(cursors)} of {(total - 1) // PAGE_SIZE + 1}")
+    now = datetime.datetime.now().timestamp()
+    st.dataframe(
+        pd.DataFrame([{
+            "Request/Complaint No.": r["complaint_no"],
+            "Priority": r["priority"],
+            "Type": r["complaint_type"],
+            "Consumer No": r["consumer_no"],
+            "Waiting (h)": round((now - r["created_at"]) / 3600, 1),
+            "Description": r["description"],
+        } for r in page]),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("⬅️ Previous", key=f"{key}_prev", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next ➡️", key=f"{key}_next", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+
+    st.markdown("---")
+    col1, col2, col3 = st.columns([2, 2, 2])
+    with col1:
+        selected = st.selectbox("Request/Complaint No.", [r["complaint_no"] for r in page], key=f"{key}_selected")
+    with col2:
+        new_priority = st.selectbox("Priority", PRIORITIES, index=len(PRIORITIES) - 1, key=f"{key}_priority")
+    with col3:
+        st.markdown("<br>", unsafe_allow_html=True)
+        resolve_btn = st.button("✅ Resolve", key=f"{key}_resolve")
+        reprioritize_btn = st.button("🔁 Change Priority", key=f"{key}_reprioritize")
+    if resolve_btn:
+        if complaints.resolve(selected):
+            st.rerun()
+        st.info(f"{selected} was already resolved")
+    if reprioritize_btn:
+        complaints.reprioritize(selected, new_priority)
+        st.rerun()
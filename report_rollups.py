@@ -0,0 +1,115 @@
+"""
+Materialized rollups for the Reports tab.
+
+Every write that matters to a report also bumps a counter in the `rollups`
+table, inside the same transaction, at two grains: the day and the month it
+falls in. Reports never group over raw history:
+- a daily or monthly series reads the buckets of that grain directly
+- a total over an arbitrary date range is assembled from whole-month buckets
+  plus day buckets for the partial months at either edge, so a year-long range
+  touches about 12 + 60 rows per dimension instead of every record
+"""
+
+import datetime
+import sqlite3
+from typing import List, Tuple
+
+import pandas as pd
+
+# Metrics kept in the rollup table; the dimension column holds the breakdown key
+COMPLAINTS = 'complaints'                  # by complaint type, bucketed on creation day
+UNRESOLVED = 'unresolved'                  # by complaint type, creation day; -1 when resolved
+RESOLVED = 'resolved'                      # by complaint type, bucketed on resolution day
+COLLECTIONS = 'collection_amount'          # by collector
+OUTAGE_MINUTES = 'outage_minutes'          # by area, split over the days the outage spans
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    metric TEXT NOT NULL,
+    grain TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (metric, grain, bucket, dimension)
+) WITHOUT ROWID;
+"""
+
+_BUMP = (
+    "INSERT INTO rollups (metric, grain, bucket, dimension, value) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (metric, grain, bucket, dimension) DO UPDATE SET value = value + excluded.value"
+)
+
+
+def buckets(when: float) -> Tuple[str, str]:
+    """Day and month bucket keys for a Unix timestamp (local time)."""
+    day = datetime.date.fromtimestamp(when)
+    return day.isoformat(), day.strftime('%Y-%m')
+
+
+def bump(conn: sqlite3.Connection, metric: str, dimension: str, when: float, amount: float = 1.0):
+    """Add amount to both grains. Call inside the transaction that writes the record."""
+    day, month = buckets(when)
+    conn.executemany(_BUMP, [
+        (metric, 'day', day, dimension or '', amount),
+        (metric, 'month', month, dimension or '', amount),
+    ])
+
+
+def bump_minutes(conn: sqlite3.Connection, metric: str, dimension: str, start: float, end: float):
+    """Add the minutes of [start, end) to each local day it overlaps (and so to each month)."""
+    while start < end:
+        next_day = datetime.date.fromtimestamp(start) + datetime.timedelta(days=1)
+        midnight = datetime.datetime.combine(next_day, datetime.time()).timestamp()
+        stop = min(end, midnight)
+        bump(conn, metric, dimension, start, (stop - start) / 60)
+        start = stop
+
+
+def split_range(start: datetime.date, end: datetime.date) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """Cover [start, end] with whole months plus the leftover day ranges at either edge."""
+    day_ranges, months = [], []
+    current = start
+    while current <= end:
+        next_month = (current.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        month_end = next_month - datetime.timedelta(days=1)
+        if current.day == 1 and month_end <= end:
+            months.append(current.strftime('%Y-%m'))
+        else:
+            day_ranges.append((current.isoformat(), min(month_end, end).isoformat()))
+        current = next_month
+    return day_ranges, months
+
+
+def totals(conn: sqlite3.Connection, metric: str, start: datetime.date, end: datetime.date) -> pd.DataFrame:
+    """Per-dimension totals over [start, end], merged from month and day buckets."""
+    day_ranges, months = split_range(start, end)
+    clauses, params = [], []
+    if months:
+        clauses.append(f"(grain = 'month' AND bucket IN ({','.join('?' * len(months))}))")
+        params.extend(months)
+    for first, last in day_ranges:
+        clauses.append("(grain = 'day' AND bucket BETWEEN ? AND ?)")
+        params.extend([first, last])
+    if not clauses:
+        return pd.DataFrame(columns=['dimension', 'value'])
+    rows = conn.execute(
+        f"SELECT dimension, SUM(value) AS value FROM rollups WHERE metric = ? AND ({' OR '.join(clauses)}) "
+        "GROUP BY dimension ORDER BY value DESC",
+        [metric, *params],
+    ).fetchall()
+    return pd.DataFrame([tuple(r) for r in rows], columns=['dimension', 'value'])
+
+
+def series(conn: sqlite3.Connection, metric: str, grain: str,
+           start: datetime.date, end: datetime.date) -> pd.DataFrame:
+    """Bucket-by-dimension values for a daily ('day') or monthly ('month') report."""
+    if grain == 'month':
+        first, last = start.strftime('%Y-%m'), end.strftime('%Y-%m')
+    else:
+        first, last = start.isoformat(), end.isoformat()
+    rows = conn.execute(
+        "SELECT bucket, dimension, value FROM rollups "
+        "WHERE metric = ? AND grain = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+        (metric, grain, first, last),
+    ).fetchall()
+    return pd.DataFrame([tuple(r) for r in rows], columns=['bucket', 'dimension', 'value'])
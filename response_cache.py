@@ -0,0 +1,183 @@
+"""
+Response cache for chat completions (app01.py, app02.py).
+
+Replies are keyed on a hash of everything that determines them: model (or
+backend), system prompt, history, temperature and max tokens. A hit is
+replayed as a stream of word-sized deltas, so the UI renders it the same way
+as a live reply.
+
+Two tiers:
+- memory: LRU, bounded by entry count and total characters
+- disk (optional, RESPONSE_CACHE_DIR): a SQLite file shared across restarts,
+  trimmed to a byte budget oldest-access first; hits are promoted to memory
+
+Both tiers expire entries after a TTL.
+
+Only deterministic requests (temperature 0) are cached. Above 0 the caller
+asked for a fresh sample every time, and replaying one stored sample would
+quietly turn sampling off.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR")
+TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL", 24 * 3600))
+MAX_ENTRIES = 1000
+MAX_CHARS = 16 << 20
+DISK_MAX_BYTES = 256 << 20
+
+
+def cache_key(model: str, system_prompt: Optional[str], history: List[Dict[str, str]],
+              temperature: float, max_tokens: Optional[int]) -> str:
+    turns = [(m['role'], m['content']) for m in history]
+    payload = json.dumps([model, system_prompt or '', turns, round(float(temperature), 4), max_tokens])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cacheable(temperature: float) -> bool:
+    """Whether a reply at this temperature may be stored and replayed."""
+    return float(temperature) == 0.0
+
+
+def replay(text: str) -> Iterator[str]:
+    """A cached reply as word-sized deltas, whitespace kept."""
+    yield from re.findall(r'^\s+|\S+\s*', text)
+
+
+class ResponseCache:
+    """LRU memory tier over an optional SQLite disk tier, both with TTL."""
+
+    def __init__(self, disk_dir: Optional[str] = CACHE_DIR, ttl: float = TTL_SECONDS,
+                 max_entries: int = MAX_ENTRIES, max_chars: int = MAX_CHARS,
+                 disk_max_bytes: int = DISK_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk = sqlite3.connect(os.path.join(disk_dir, 'responses.db'), check_same_thread=False)
+            self._disk.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+            """)
+            self._disk.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            self._disk.commit()
+            self._disk_bytes = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    # -------------------- Memory tier --------------------
+
+    def _remember(self, key: str, text: str, created_at: float):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._chars -= len(old[0])
+        self._memory[key] = (text, created_at)
+        self._chars += len(text)
+        while self._memory and (len(self._memory) > self.max_entries or self._chars > self.max_chars):
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._chars -= len(evicted)
+
+    def _forget(self, key: str):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._chars -= len(old[0])
+
+    # -------------------- Public --------------------
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._forget(key)
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT text, created_at FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl),
+                ).fetchone()
+                if row is not None:
+                    self._disk.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._disk.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, text: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, text, now)
+            if self._disk is not None:
+                size = len(text.encode('utf-8'))
+                old = self._disk.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._disk_bytes += size - (old[0] if old else 0)
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, text, created_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                    (key, text, now, now, size),
+                )
+                if self._disk_bytes > self.disk_max_bytes:
+                    self._trim_disk(now)
+                self._disk.commit()
+
+    def _trim_disk(self, now: float):
+        self._disk.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        # Then drop least recently accessed rows until back under budget
+        self._disk.execute("""
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS kept FROM responses
+                ) WHERE kept > ?
+            )
+        """, (self.disk_max_bytes,))
+        self._disk_bytes = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._chars = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM responses")
+                self._disk.commit()
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._memory),
+                'chars': self._chars,
+                'disk_bytes': self._disk_bytes,
+            }
@@ -0,0 +1,57 @@
+"""
+Batched rendering of streamed replies into a Streamlit placeholder.
+
+Backends yield small deltas. Re-rendering the whole reply as markdown for
+each one costs a full markdown pass and a websocket message per token.
+StreamRenderer appends deltas to a list and redraws the placeholder at most
+once per interval, or sooner when enough new text has piled up. A reply
+therefore costs a bounded number of redraws per second, however fast the
+tokens arrive.
+"""
+
+import time
+from typing import List
+
+FLUSH_INTERVAL = 0.05
+FLUSH_CHARS = 2048
+CURSOR = '▌'
+
+
+class StreamRenderer:
+    """List-backed text builder that flushes to a placeholder on a time or size budget."""
+
+    def __init__(self, placeholder, interval: float = FLUSH_INTERVAL, flush_chars: int = FLUSH_CHARS,
+                 cursor: str = CURSOR):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.flush_chars = flush_chars
+        self.cursor = cursor
+        self._parts: List[str] = []
+        self._pending = 0
+        self._flushed_at = 0.0
+        self.flushes = 0
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = [''.join(self._parts)]
+        return self._parts[0] if self._parts else ''
+
+    def write(self, delta: str):
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._pending += len(delta)
+        if self._pending >= self.flush_chars or time.monotonic() - self._flushed_at >= self.interval:
+            self.flush()
+
+    def flush(self, final: bool = False):
+        self.placeholder.markdown(self.text if final else self.text + self.cursor)
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        self.flushes += 1
+
+    def close(self) -> str:
+        """Draw the finished reply without the cursor and return it."""
+        self.flush(final=True)
+        return self.text
@@ -1,5 +1,17 @@
+import datetime
+
 import streamlit as st
 
+import report_rollups as rollups
+from complaint_store import ComplaintStore, DB_PATH
+from pending_requests import render_pending_requests
+
+
+@st.cache_resource
+def get_complaint_store():
+    return ComplaintStore(DB_PATH)
+
+
 st.title("Navigation Panel")
 
 # -------------------------------
@@ -48,7 +60,7 @@ with tab2:
 # -------------------------------
 with tab3:
     st.subheader("Pending Request")
-    st.warning("Showing all pending requests...")
+    render_pending_requests(get_complaint_store())
 
 
 # -------------------------------
@@ -90,7 +102,46 @@ with tab6:
 # -------------------------------
 with tab7:
     st.subheader("Reports")
-    st.write("No submenu available.")
+    report_store = get_complaint_store()
+    col1, col2 = st.columns(2)
+    with col1:
+        today = datetime.date.today()
+        report_range = st.date_input("Date Range", value=(today.replace(day=1), today))
+    with col2:
+        grain = st.radio("Report Type", ["Daily", "Monthly"], horizontal=True)
+    
+    if len(report_range) == 2:
+        start, end = report_range
+        bucket = "day" if grain == "Daily" else "month"
+        
+        resolved = report_store.report_totals(rollups.RESOLVED, start, end)["value"].sum()
+        unresolved = report_store.report_totals(rollups.UNRESOLVED, start, end)["value"].sum()
+        col1, col2 = st.columns(2)
+        col1.metric("Resolved", f"{int(resolved):,}")
+        col2.metric("Unresolved (raised in range)", f"{int(unresolved):,}")
+        
+        reports = [
+            ("Complaints by Type", rollups.COMPLAINTS),
+            ("Collections by Collector (₹)", rollups.COLLECTIONS),
+            ("Outage Minutes by Area", rollups.OUTAGE_MINUTES),
+        ]
+        for title, metric in reports:
+            st.markdown(f"**{title}**")
+            by_bucket = report_store.report_series(metric, bucket, start, end)
+            if by_bucket.empty:
+                st.caption("No data for this period.")
+                continue
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                st.dataframe(
+                    report_store.report_totals(metric, start, end).rename(columns={"dimension": "", "value": "Total"}),
+                    use_container_width=True,
+                    hide_index=True
+                )
+            with col2:
+                st.bar_chart(by_bucket.pivot(index="bucket", columns="dimension", values="value").fillna(0))
+    else:
+        st.info("Select a start and end date.")
 
 
 # -------------------------------
@@ -0,0 +1,32 @@
+import threading
+
+import pytest
+
+import local_backend
+from chat_backend import ConversationSync, open_turn
+from http_client import PooledHTTPClient, origin
+
+
+@pytest.fixture
+def endpoint():
+    server = local_backend.serve(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/chat"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_turns_reuse_one_pooled_connection(endpoint, streaming):
+    client = PooledHTTPClient()
+    sync = ConversationSync()
+    messages = []
+    for i in range(5):
+        messages.append({"role": "user", "content": f"question {i}"})
+        reply = open_turn(client, endpoint, messages, {}, {}, sync=sync, streaming=streaming)
+        text = "".join(reply)
+        assert reply.ok and text.endswith(f"question {i}")
+        messages.append({"role": "assistant", "content": text})
+        sync.acknowledge(reply.conversation_id, len(messages))
+    assert client.metrics()[origin(endpoint)]["connections_opened"] == 1
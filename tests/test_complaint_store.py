@@ -0,0 +1,49 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from complaint_store import ComplaintStore, parse_complaint_no
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("RC00000042", 42),
+    ("rc42", 42),
+    (" 42 ", 42),
+    ("RC" + "9" * 18, 10 ** 18 - 1),
+    ("RC" + "9" * 25, None),
+    ("²", None),
+    ("RC٤٢", None),
+    ("", None),
+    ("RC", None),
+])
+def test_parse_complaint_no(text, expected):
+    assert parse_complaint_no(text) == expected
+
+
+def test_get_rejects_bad_numbers(tmp_path):
+    store = ComplaintStore(str(tmp_path / "complaints.db"))
+    complaint_no = store.register("Billing", "wrong amount", "High", "C1")
+    assert store.get(complaint_no)["complaint_no"] == complaint_no
+    assert store.get("RC" + "9" * 25) is None
+    assert store.get("²") is None
+
+
+def test_single_and_bulk_collections_update_the_bill(tmp_path):
+    store = ComplaintStore(str(tmp_path / "complaints.db"))
+    store.record_collection("COL-1", 400, datetime.date(2024, 1, 5), "Asha", "C1",
+                            bill_no="B1", amount_due=1000.0, due_date="2099-01-31")
+    assert store.bill_payments(["B1"]).to_dict("records") == [
+        {"bill_no": "B1", "paid_amount": 400.0, "payment_status": "Pending"}
+    ]
+    rows = pd.DataFrame([{
+        "collection_id": "COL-2", "consumer_no": "C1", "bill_no": "B1", "amount": 600.0,
+        "collection_date": "2024-01-06", "collector_name": "Asha", "amount_due": 1000.0, "due_date": "2099-01-31",
+    }])
+    store.ingest_collections(rows)
+    assert store.bill_payments(["B1"])["payment_status"].tolist() == ["Paid"]
+    with pytest.raises(ValueError):
+        store.record_collection("COL-1", 10, datetime.date(2024, 1, 7), "Asha", "C1")
+    # Without a bill the collection is still recorded
+    store.record_collection("COL-3", 50, datetime.date(2024, 1, 7), "Asha", "C1")
+    assert store.bill_payments([""]).empty
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from consumer_search import ConsumerSearchIndex, FieldIndex
+
+
+def names(index: FieldIndex, query: str):
+    return [index.keys[row] for row in index.fuzzy(query)]
+
+
+def test_fuzzy_finds_spelling_variants():
+    index = FieldIndex(pd.Series(["Sita Sahu", "Ram Das", "Susant Sahoo", "Gita Mohanty"]))
+    assert "sita sahu" in names(index, "sahoo")
+    assert "susant sahoo" in names(index, "sahu")
+    assert names(index, "mohanti") == ["gita mohanty"]
+
+
+def test_fuzzy_budget_grows_with_query_length():
+    index = FieldIndex(pd.Series(["das"]))
+    assert names(index, "dash") == ["das"]
+    assert names(index, "dxsh") == []
+
+
+def test_search_by_name():
+    consumers = pd.DataFrame({"consumer_no": ["C1", "C2"], "consumer_name": ["Sita Sahu", "Ram Das"]})
+    index = ConsumerSearchIndex(consumers, fields=["consumer_no", "consumer_name"])
+    assert index.search({"consumer_name": "sahoo"}, "Fuzzy")["consumer_no"].tolist() == ["C1"]
+
+
+def test_fuzzy_name_with_other_fields():
+    n = 3000
+    consumers = pd.DataFrame({
+        "consumer_no": [f"C{i}" for i in range(n)],
+        "consumer_name": ["Sita Sahu"] * n,
+        "pole_no": [f"P-{i:04d}" for i in range(n)],
+    })
+    index = ConsumerSearchIndex(consumers, fields=["consumer_no", "consumer_name", "pole_no"])
+    # More same-named rows than any per-field cut-off; the pole narrows them first
+    assert index.search({"consumer_name": "sahoo", "pole_no": "P-2999"}, "Fuzzy")["consumer_no"].tolist() == ["C2999"]
+    # Other fields are matched as substrings, not fuzzily
+    assert index.search({"consumer_no": "C299"}, "Fuzzy")["consumer_no"].tolist() == [f"C299{d}" for d in [""] + list("0123456789")]
+    assert index.search({"consumer_no": "C2x99"}, "Fuzzy").empty
@@ -0,0 +1,20 @@
+from conversation_store import ConversationStore, match_query
+
+
+def test_match_query_prefixes():
+    assert match_query("meter rea") == '"meter" "rea"*'
+    assert match_query("bill* r") == '"bill"* "r"'
+
+
+def test_search_stays_within_the_given_conversations(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"))
+    if not store.searchable:
+        return
+    mine, _ = store.create("app01")
+    other, _ = store.create("app01")
+    store.append(mine, "user", "meter reading for pole 7")
+    store.append(other, "user", "meter reading is secret")
+    hits = store.search("meter rea", [mine])
+    assert [hit["conversation_id"] for hit in hits] == [mine]
+    # A conversation id is not a content term
+    assert store.search(str(other), [mine, other]) == []
@@ -0,0 +1,63 @@
+import datetime
+
+import pandas as pd
+
+import report_rollups as rollups
+from complaint_store import ComplaintStore
+from outage_engine import OutageEngine
+
+CONSUMERS = pd.DataFrame({"pole_no": ["P1", "P1", "P2"]})
+POLES = pd.DataFrame({"pole_no": ["P1", "P2"], "feeder_no": ["F1", "F1"], "area": ["North", "North"]})
+
+
+def at(day, hour):
+    return datetime.datetime(2024, 1, day, hour).timestamp()
+
+
+def flush(store):
+    store._enqueue(lambda conn: None).result(5)
+
+
+def minutes(store, grain, start, end):
+    report = store.report_series(rollups.OUTAGE_MINUTES, grain, start, end)
+    return {bucket: value for bucket, _, value in report.itertuples(index=False)}
+
+
+def test_overlapping_outages_count_the_area_once(tmp_path):
+    store = ComplaintStore(str(tmp_path / "complaints.db"))
+    engine = OutageEngine(CONSUMERS, POLES, log=store)
+    engine.set_pole("P1", True, at=at(1, 10))
+    engine.set_feeder("F1", True, at=at(1, 11))
+    engine.set_pole("P1", False, at=at(1, 12))
+    engine.set_feeder("F1", False, at=at(1, 13))
+    flush(store)
+    day = datetime.date(2024, 1, 1)
+    assert minutes(store, "day", day, day) == {"2024-01-01": 180.0}
+
+
+def test_minutes_split_across_days_and_months(tmp_path):
+    store = ComplaintStore(str(tmp_path / "complaints.db"))
+    engine = OutageEngine(CONSUMERS, POLES, log=store)
+    engine.set_feeder("F1", True, at=datetime.datetime(2024, 1, 31, 23).timestamp())
+    engine.set_feeder("F1", False, at=datetime.datetime(2024, 2, 1, 2).timestamp())
+    flush(store)
+    start, end = datetime.date(2024, 1, 1), datetime.date(2024, 2, 29)
+    assert minutes(store, "day", start, end) == {"2024-01-31": 60.0, "2024-02-01": 120.0}
+    assert minutes(store, "month", start, end) == {"2024-01": 60.0, "2024-02": 120.0}
+
+
+def test_restart_keeps_start_times(tmp_path):
+    path = str(tmp_path / "complaints.db")
+    store = ComplaintStore(path)
+    OutageEngine(CONSUMERS, POLES, log=store).set_pole("P1", True, at=at(2, 8))
+    flush(store)
+
+    store = ComplaintStore(path)
+    engine = OutageEngine(CONSUMERS, POLES, log=store)
+    assert engine.affected_area("North") == 2
+    assert engine.started_at[("Pole", "P1")] == at(2, 8)
+    engine.set_pole("P1", False, at=at(2, 9))
+    flush(store)
+    day = datetime.date(2024, 1, 2)
+    assert minutes(store, "day", day, day) == {"2024-01-02": 60.0}
+    assert store.active_outages() == ([], {})
@@ -0,0 +1,152 @@
+"""
+Read-only columnar store for consumer, bill, collection and network data.
+
+Each table lives in an uncompressed Arrow IPC file (<data_dir>/<name>.arrow)
+that is memory-mapped rather than read into the heap. Pages come from the OS
+page cache, so every Streamlit session in the process (and every process on
+the box) shares one physical copy of the data. main.py opens the store once
+through st.cache_resource.
+
+Bills and collections are written sorted by consumer_no, so per-consumer
+lookups are a binary search plus a zero-copy slice.
+
+Build the files from CSV exports with:
+    python utility_store.py bills exports/bills.csv --data-dir data
+"""
+
+import argparse
+import bisect
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+DATA_DIR = os.environ.get("UTILITY_DATA_DIR", "data")
+
+# Table name -> (string key columns, sort order used when writing)
+TABLES = {
+    'consumers': (
+        ['consumer_no', 'account_no', 'phone', 'consumer_name', 'house_no', 'pole_no', 'meter_no'],
+        ['consumer_no'],
+    ),
+    'bills': (
+        ['bill_no', 'consumer_no', 'billing_period', 'payment_status', 'payment_method'],
+        ['consumer_no', 'bill_date'],
+    ),
+    'collections': (
+        ['collection_id', 'consumer_no', 'bill_no', 'collector_name'],
+        ['consumer_no', 'collection_date'],
+    ),
+    # Network hierarchy: each pole hangs off one feeder, each feeder serves one area
+    'poles': (
+        ['pole_no', 'feeder_no', 'area'],
+        ['pole_no'],
+    ),
+}
+
+
+class _SortedColumn:
+    """Sequence view over a sorted Arrow string column, usable with bisect."""
+
+    def __init__(self, column: pa.ChunkedArray):
+        self.column = column
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self, i):
+        return self.column[i].as_py()
+
+
+class UtilityStore:
+    """Memory-mapped Arrow tables, opened once and shared read-only."""
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+        self.tables: Dict[str, pa.Table] = {}
+        self._keys: Dict[str, _SortedColumn] = {}
+        for name in TABLES:
+            path = table_path(name, data_dir)
+            if os.path.exists(path):
+                # The table's buffers point into the mapping, so it stays open for the store's lifetime
+                source = pa.memory_map(path, 'r')
+                self.tables[name] = pa.ipc.open_file(source).read_all()
+                if 'consumer_no' in self.tables[name].column_names:
+                    self._keys[name] = _SortedColumn(self.tables[name].column('consumer_no'))
+
+    def has(self, name: str) -> bool:
+        return name in self.tables
+
+    def num_rows(self, name: str) -> int:
+        return self.tables[name].num_rows if name in self.tables else 0
+
+    def frame(self, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Materialize (part of) a table as a DataFrame. Copies; use for shared, process-wide objects."""
+        if name not in self.tables:
+            return pd.DataFrame(columns=columns or TABLES[name][0])
+        table = self.tables[name]
+        if columns:
+            table = table.select([c for c in columns if c in table.column_names])
+        return table.to_pandas()
+
+    def rows_for(self, name: str, consumer_no: str) -> pd.DataFrame:
+        """All rows of a table belonging to one consumer, oldest first."""
+        consumer_no = (consumer_no or '').strip()
+        if name not in self._keys or not consumer_no:
+            return pd.DataFrame(columns=TABLES[name][0])
+        keys = self._keys[name]
+        lo = bisect.bisect_left(keys, consumer_no)
+        hi = bisect.bisect_right(keys, consumer_no)
+        return self.tables[name].slice(lo, hi - lo).to_pandas()
+
+    def bills_for(self, consumer_no: str) -> pd.DataFrame:
+        return self.rows_for('bills', consumer_no)
+
+    def collections_for(self, consumer_no: str) -> pd.DataFrame:
+        return self.rows_for('collections', consumer_no)
+
+    def latest_bill(self, consumer_no: str) -> Optional[Dict]:
+        bills = self.bills_for(consumer_no)
+        if bills.empty:
+            return None
+        return bills.iloc[-1].to_dict()
+
+
+# -------------------- Writing --------------------
+
+def table_path(name: str, data_dir: str = DATA_DIR) -> str:
+    return os.path.join(data_dir, f"{name}.arrow")
+
+
+def write_table(name: str, table: pa.Table, data_dir: str = DATA_DIR) -> str:
+    """Sort a table by its key columns and write it as an uncompressed Arrow file."""
+    sort_columns = TABLES[name][1]
+    table = table.sort_by([(c, 'ascending') for c in sort_columns if c in table.column_names])
+    os.makedirs(data_dir, exist_ok=True)
+    path = table_path(name, data_dir)
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    # Readers that already mapped the old file keep their view until they reopen
+    os.replace(tmp_path, path)
+    return path
+
+
+def import_csv(name: str, csv_path: str, data_dir: str = DATA_DIR) -> str:
+    """Convert a CSV export into the store, keeping identifier columns as strings."""
+    key_columns = TABLES[name][0]
+    convert_options = pacsv.ConvertOptions(column_types={c: pa.string() for c in key_columns})
+    table = pacsv.read_csv(csv_path, convert_options=convert_options)
+    return write_table(name, table, data_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import a CSV export into the utility data store")
+    parser.add_argument('table', choices=list(TABLES))
+    parser.add_argument('csv_path')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    args = parser.parse_args()
+    print(import_csv(args.table, args.csv_path, args.data_dir))